@@ -5,6 +5,7 @@ from gui.ui_abstract_base import AbstractBaseUI
 from gui.ui_components_html import GradioComponentsHTML
 from gui.ui_tab_asset_library import AssetLibrary
 from gui.ui_tab_config import ConfigUI
+from shortGPT.audio.whisper_model_pool import WHISPER_MODEL_POOL
 from shortGPT.utils.cli import CLI
 
 
@@ -93,6 +94,8 @@ class ShortGptUI(AbstractBaseUI):
         """Launch the server"""
         # Create the user interface
         shortGptUI = self.create_interface()
+        # The caption timing model loads while the UI starts, instead of in the first request
+        WHISPER_MODEL_POOL.warm_up()
 
         # Print a clear startup message if not in Colab
         if not getattr(self, 'colab', False):
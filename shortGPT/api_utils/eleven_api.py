@@ -2,6 +2,10 @@ import json
 
 import requests
 
+ELEVEN_MODEL_ID = "eleven_multilingual_v2"
+ELEVEN_STABILITY = 0.2
+ELEVEN_CLARITY = 0.1
+
 
 class ElevenLabsAPI:
 
@@ -32,7 +36,7 @@ class ElevenLabsAPI:
         else:
             raise Exception(response.json()['detail']['message'])
 
-    def generate_voice(self, text, character, filename, stability=0.2, clarity=0.1):
+    def generate_voice(self, text, character, filename, stability=ELEVEN_STABILITY, clarity=ELEVEN_CLARITY, model_id=ELEVEN_MODEL_ID):
         '''Generate a voice'''
         if character not in self.voices:
             print(character, 'is not in the array of characters: ', list(self.voices.keys()))
@@ -40,7 +44,7 @@ class ElevenLabsAPI:
         voice_id = self.voices[character]
         url = f'{self.url_base}text-to-speech/{voice_id}/stream'
         headers = {'accept': '*/*', 'xi-api-key': self.api_key, 'Content-Type': 'application/json'}
-        data = json.dumps({"model_id": "eleven_multilingual_v2", "text": text, "stability": stability, "similarity_boost": clarity})
+        data = json.dumps({"model_id": model_id, "text": text, "stability": stability, "similarity_boost": clarity})
         response = requests.post(url, headers=headers, data=data)
 
         if response.status_code == 200:
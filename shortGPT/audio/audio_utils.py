@@ -1,16 +1,16 @@
 import os
 import subprocess
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import yt_dlp
 
 from shortGPT.audio.audio_duration import get_asset_duration
+from shortGPT.audio.whisper_model_pool import WHISPER_MODEL_POOL
 
 CONST_CHARS_PER_SEC = 20.5  # Arrived to this result after whispering a ton of shorts and calculating the average number of characters per second of speech.
 
-WHISPER_MODEL = None
-
-
 
 def downloadYoutubeAudio(url, outputFile):
     ydl_opts = {
@@ -54,6 +54,58 @@ def speedUpAudio(tempAudioPath, outputFile, expected_duration=None):
     if (os.path.exists(outputFile)):
         return outputFile
 
+def _replaceWhenWritten(tmpFile, outputFile):
+    # Per-block files are only written under their final name once complete, so that they can be resumed from
+    if not tmpFile or not os.path.exists(tmpFile) or not os.path.getsize(tmpFile):
+        return None
+    os.replace(tmpFile, outputFile)
+    return outputFile
+
+
+def generateTimedVoiceBlocks(voiceModule, timedTexts, outputPrefix, suffix='', max_concurrency=None, logger=None):
+    """
+    Synthesizes the voice of each ((t1, t2), text) block to {outputPrefix}{i}{suffix}.wav and speeds it
+    up to fit its timing in {outputPrefix}{i}{suffix}_spedup.wav. The blocks are synthesized in parallel,
+    at most max_concurrency at a time (the max_concurrency of the voice module by default), and post-processed
+    as soon as their voice is ready. Blocks whose files are already in place are not generated again.
+    Returns the [[t1, t1+duration], spedup_audio_path] blocks, in the order of timedTexts.
+    """
+    max_concurrency = max(1, max_concurrency or getattr(voiceModule, 'max_concurrency', 1))
+    synthesisSlots = threading.Semaphore(max_concurrency)
+
+    def generateBlock(i, t1, t2, text):
+        voicePath = f"{outputPrefix}{i}{suffix}.wav"
+        spedupPath = f"{outputPrefix}{i}{suffix}_spedup.wav"
+        if not os.path.exists(spedupPath):
+            if not os.path.exists(voicePath):
+                with synthesisSlots:
+                    tmpVoice = voiceModule.generate_voice(text, f"{outputPrefix}{i}{suffix}.tmp.wav")
+                if not _replaceWhenWritten(tmpVoice, voicePath):
+                    raise Exception('An error happending during audio voice creation')
+            tmpSpedup = f"{outputPrefix}{i}{suffix}_spedup.tmp.wav"
+            if os.path.exists(tmpSpedup):
+                os.remove(tmpSpedup)
+            if not _replaceWhenWritten(speedUpAudio(voicePath, tmpSpedup, expected_duration=t2-t1 - 0.05), spedupPath):
+                raise Exception(f"Failed to speed up the audio of block {i}")
+        _, duration = get_asset_duration(spedupPath, isVideo=False)
+        return [[t1, t1+duration], spedupPath]
+
+    blocks = [None] * len(timedTexts)
+    # ffmpeg post-processing runs next to the synthesis, on at least one worker per core
+    with ThreadPoolExecutor(max_workers=max(max_concurrency, os.cpu_count() or 1)) as executor:
+        futures = {executor.submit(generateBlock, i, t1, t2, text): i for i, ((t1, t2), text) in enumerate(timedTexts)}
+        try:
+            for n_done, future in enumerate(as_completed(futures), start=1):
+                blocks[futures[future]] = future.result()
+                if logger:
+                    logger(f"{n_done} / {len(timedTexts)}")
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+    return blocks
+
+
 def ChunkForAudio(alltext, chunk_size=2500):
     alltext_list = alltext.split('.')
     chunks = []
@@ -69,12 +121,10 @@ def ChunkForAudio(alltext, chunk_size=2500):
     return chunks
 
 
-def audioToText(filename, model_size="base"):
-    from whisper_timestamped import load_model, transcribe_timestamped
-    global WHISPER_MODEL
-    if (WHISPER_MODEL == None):
-        WHISPER_MODEL = load_model(model_size)
-    gen = transcribe_timestamped(WHISPER_MODEL, filename, verbose=False, fp16=False)
+def audioToText(filename, model_size="base", device=None):
+    from whisper_timestamped import transcribe_timestamped
+    with WHISPER_MODEL_POOL.use_model(model_size, device) as model:
+        gen = transcribe_timestamped(model, filename, verbose=False, fp16=False)
     return gen
 
 
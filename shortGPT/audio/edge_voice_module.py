@@ -1,6 +1,8 @@
 import asyncio
+import inspect
 import os
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 
 import edge_tts
 
@@ -9,13 +11,73 @@ from shortGPT.config.languages import (EDGE_TTS_VOICENAME_MAPPING,
                                        LANGUAGE_ACRONYM_MAPPING, Language)
 
 
-def run_async_func(loop, func):
-    return loop.run_until_complete(func)
+# edge_tts offsets and durations are in 100 nanoseconds units
+EDGE_TTS_TICKS_PER_SECOND = 10_000_000
+# Seconds an utterance may take to stream before it is retried
+EDGE_TTS_TIMEOUT = 60
+EDGE_TTS_MAX_RETRIES = 3
+# Seconds waited before the first retry, doubled on each following one
+EDGE_TTS_RETRY_BACKOFF = 1.0
+
+
+class BackgroundEventLoop:
+    """
+    Event loop running forever on a daemon thread, started by its first use.
+    Synchronous code runs coroutines on it and waits for their result, so that
+    the edge_tts streams of every voice module share one loop.
+    """
+
+    def __init__(self, name='edge-tts-loop'):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run(self, coroutine):
+        """Runs the coroutine on the loop, and returns its result once it is done."""
+        loop = self.get_loop()
+        if threading.current_thread() is self._thread:
+            coroutine.close()
+            raise Exception(f"{self.name} can't wait on itself, await the async API from the loop instead")
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+EDGE_TTS_LOOP = BackgroundEventLoop()
+
+
+def align_word_boundaries(text, word_boundaries):
+    # The spoken words have no punctuation, each one is extended to the word of the text it was read from
+    word_timings = []
+    position = 0
+    for boundary in word_boundaries:
+        start = text.find(boundary['text'], position)
+        word = boundary['text']
+        if start != -1:
+            end = start + len(word)
+            while end < len(text) and not text[end].isspace():
+                end += 1
+            word = text[start:end]
+            position = end
+        word_timings.append({'text': word, 'start': boundary['start'], 'end': boundary['end']})
+    return word_timings
 
 
 class EdgeTTSVoiceModule(VoiceModule):
-    def __init__(self, voiceName):
+    max_concurrency = 8
+
+    def __init__(self, voiceName, timeout=EDGE_TTS_TIMEOUT, max_retries=EDGE_TTS_MAX_RETRIES, retry_backoff=EDGE_TTS_RETRY_BACKOFF):
         self.voiceName = voiceName
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
         super().__init__()
 
     def update_usage(self):
@@ -24,29 +86,72 @@ class EdgeTTSVoiceModule(VoiceModule):
     def get_remaining_characters(self):
         return 999999999999
 
+    def get_cache_settings(self):
+        return {'voice': self.voiceName}
+
     def generate_voice(self, text, outputfile):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        return self.generate_voice_with_timings(text, outputfile)[0]
+
+    def generate_voice_with_timings(self, text, outputfile):
+        return EDGE_TTS_LOOP.run(self.async_generate_voice_with_timings(text, outputfile))
+
+    def generate_voices(self, texts_and_files: List[Tuple[str, str]]) -> List[str]:
+        """Generates the (text, outputfile) voices concurrently, and returns the output files in the same order."""
+        return EDGE_TTS_LOOP.run(self.async_generate_voices(texts_and_files))
+
+    def generate_voices_with_timings(self, texts_and_files: List[Tuple[str, str]]) -> List[Tuple[str, Optional[List[Dict[str, Any]]]]]:
+        """Generates the (text, outputfile) voices concurrently, and returns their (outputfile, word_timings) in the same order."""
+        return EDGE_TTS_LOOP.run(self.async_generate_voices_with_timings(texts_and_files))
 
-        try:
-            with ThreadPoolExecutor() as executor:
-                loop.run_in_executor(executor, run_async_func, loop, self.async_generate_voice(text, outputfile))
+    async def async_generate_voices(self, texts_and_files: List[Tuple[str, str]]) -> List[str]:
+        return [outputfile for outputfile, _ in await self.async_generate_voices_with_timings(texts_and_files)]
 
-        finally:
-            loop.close()
-        if not os.path.exists(outputfile):
-            print("An error happened during edge_tts audio generation, no output audio generated")
-            raise Exception("An error happened during edge_tts audio generation, no output audio generated")
-        return outputfile
+    async def async_generate_voices_with_timings(self, texts_and_files: List[Tuple[str, str]]) -> List[Tuple[str, Optional[List[Dict[str, Any]]]]]:
+        slots = asyncio.Semaphore(max(1, self.max_concurrency))
+
+        async def generate(text, outputfile):
+            async with slots:
+                return await self.async_generate_voice_with_timings(text, outputfile)
+
+        results = await asyncio.gather(*[generate(text, outputfile) for text, outputfile in texts_and_files], return_exceptions=True)
+        # The voices generated before a failure are kept, a new batch can skip them
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise Exception(f"{len(errors)} / {len(results)} edge_tts voices failed to generate", errors[0])
+        return results
+
+    async def async_generate_voice_with_timings(self, text, outputfile):
+        for attempt in range(self.max_retries + 1):
+            word_boundaries = []
+            try:
+                await asyncio.wait_for(self._stream_voice(text, outputfile, word_boundaries), self.timeout)
+                if os.path.exists(outputfile) and os.path.getsize(outputfile):
+                    return outputfile, align_word_boundaries(text, word_boundaries) or None
+                error = Exception("no output audio generated")
+            except Exception as e:
+                error = e
+            if os.path.exists(outputfile):
+                os.remove(outputfile)
+            if attempt < self.max_retries:
+                delay = self.retry_backoff * 2 ** attempt
+                print(f"Failed to generate audio using edge_tts, retrying in {delay:.1f}s. Error : {str(error) or type(error).__name__}")
+                await asyncio.sleep(delay)
+        raise Exception("An error happened during edge_tts audio generation, no output audio generated", error)
 
     async def async_generate_voice(self, text, outputfile):
-        try:
-            communicate = edge_tts.Communicate(text, self.voiceName)
-            with open(outputfile, "wb") as file:
-                async for chunk in communicate.stream():
-                    if chunk["type"] == "audio":
-                        file.write(chunk["data"])
-        except Exception as e:
-            print("Error generating audio using edge_tts", e)
-            raise Exception("An error happened during edge_tts audio generation, no output audio generated", e)
-        return outputfile
+        return (await self.async_generate_voice_with_timings(text, outputfile))[0]
+
+    async def _stream_voice(self, text, outputfile, word_boundaries):
+        communicate_args = {}
+        # Since edge_tts 7, the word boundaries are only sent on request
+        if 'boundary' in inspect.signature(edge_tts.Communicate).parameters:
+            communicate_args['boundary'] = 'WordBoundary'
+        communicate = edge_tts.Communicate(text, self.voiceName, **communicate_args)
+        with open(outputfile, "wb") as file:
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    file.write(chunk["data"])
+                elif chunk["type"] == "WordBoundary":
+                    word_boundaries.append({'text': chunk['text'],
+                                            'start': chunk['offset'] / EDGE_TTS_TICKS_PER_SECOND,
+                                            'end': (chunk['offset'] + chunk['duration']) / EDGE_TTS_TICKS_PER_SECOND})
@@ -1,8 +1,12 @@
-from shortGPT.api_utils.eleven_api import ElevenLabsAPI
+from shortGPT.api_utils.eleven_api import (ELEVEN_CLARITY, ELEVEN_MODEL_ID,
+                                           ELEVEN_STABILITY, ElevenLabsAPI)
 from shortGPT.audio.voice_module import VoiceModule
 
 
 class ElevenLabsVoiceModule(VoiceModule):
+    # Concurrent requests allowed by the smaller ElevenLabs plans
+    max_concurrency = 2
+
     def __init__(self, api_key, voiceName, checkElevenCredits=False):
         self.api_key = api_key
         self.voiceName = voiceName
@@ -20,6 +24,9 @@ class ElevenLabsVoiceModule(VoiceModule):
     def get_remaining_characters(self):
         return self.remaining_credits if self.remaining_credits else self.eleven_labs_api.get_remaining_characters()
 
+    def get_cache_settings(self):
+        return {'voice': self.voiceName, 'model_id': ELEVEN_MODEL_ID, 'stability': ELEVEN_STABILITY, 'similarity_boost': ELEVEN_CLARITY}
+
     def generate_voice(self, text, outputfile):
         if self.get_remaining_characters() >= len(text):
             file_path =self.eleven_labs_api.generate_voice(text=text, character=self.voiceName, filename=outputfile)
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from shortGPT.audio.voice_module import VoiceModule
+
+VOICE_CACHE_DIR = '.editing_assets/voice_cache/'
+VOICE_CACHE_MAX_SIZE = 1024 ** 3
+
+
+def normalize_text(text: str) -> str:
+    # Texts differing only by their unicode form or their spacing are spoken the same
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+
+class VoiceCache:
+    """
+    Content-addressed cache of generated voices, shared by every content engine.
+    A voice is keyed by the provider, the cache settings of its voice module (voice,
+    model, ...) and the hash of the normalized text, with the word timings returned
+    along with it. The cache is bounded to max_size bytes, least recently used voices
+    are evicted first.
+    """
+
+    def __init__(self, cache_dir=VOICE_CACHE_DIR, max_size=VOICE_CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_key(self, provider: str, settings: Dict[str, Any], text: str) -> str:
+        text_hash = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+        canonical = {'provider': provider, 'settings': settings, 'text': text_hash}
+        return hashlib.sha256(json.dumps(canonical, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, key, output_file) -> Optional[Tuple[str, Optional[List[Dict[str, Any]]]]]:
+        """Copies the cached voice to output_file and returns it with its word timings, None on a miss."""
+        audio_path, timings_path = self._get_cached_paths(key)
+        try:
+            # Refreshing the modification time keeps the voice at the end of the LRU order
+            os.utime(audio_path)
+            self._copy(audio_path, output_file)
+            word_timings = None
+            if os.path.exists(timings_path):
+                with open(timings_path, 'r', encoding='utf-8') as f:
+                    word_timings = json.load(f)
+        except FileNotFoundError:
+            # Missing, or evicted while it was read
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return output_file, word_timings
+
+    def put(self, key, output_file, word_timings=None):
+        audio_path, timings_path = self._get_cached_paths(key)
+        os.makedirs(os.path.dirname(audio_path), exist_ok=True)
+        tmp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        if word_timings:
+            with open(timings_path + tmp_suffix, 'w', encoding='utf-8') as f:
+                json.dump(word_timings, f)
+            os.replace(timings_path + tmp_suffix, timings_path)
+        shutil.copyfile(output_file, audio_path + tmp_suffix)
+        os.replace(audio_path + tmp_suffix, audio_path)
+        self.evict()
+
+    def evict(self):
+        cached_files = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.audio'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    cached_files.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in cached_files)
+        for _, size, path in sorted(cached_files):
+            if total_size <= self.max_size:
+                break
+            for cached_path in (path, path[:-len('.audio')] + '.json'):
+                try:
+                    os.remove(cached_path)
+                except FileNotFoundError:
+                    pass
+            total_size -= size
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def _get_cached_paths(self, key):
+        path = os.path.join(self.cache_dir, key[:2], key)
+        return f"{path}.audio", f"{path}.json"
+
+    def _copy(self, cached_path, output_file):
+        if os.path.dirname(output_file):
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        # Copied rather than hardlinked: a later in-place write to the output would otherwise corrupt the cached voice
+        shutil.copyfile(cached_path, output_file)
+
+
+VOICE_CACHE = VoiceCache()
+
+
+class CachedVoiceModule(VoiceModule):
+    """
+    Voice module serving the voices of the wrapped voice module from a VoiceCache.
+    A cached voice is copied to the output file without calling the wrapped module,
+    so it costs no request and no credits. Voice modules whose get_cache_settings
+    returns None are never cached.
+    """
+
+    def __init__(self, voiceModule: VoiceModule, cache: VoiceCache = VOICE_CACHE):
+        self.voiceModule = voiceModule
+        self.cache = cache
+        super().__init__()
+
+    @property
+    def max_concurrency(self):
+        return self.voiceModule.max_concurrency
+
+    @max_concurrency.setter
+    def max_concurrency(self, value):
+        self.voiceModule.max_concurrency = value
+
+    def update_usage(self):
+        return self.voiceModule.update_usage()
+
+    def get_remaining_characters(self):
+        return self.voiceModule.get_remaining_characters()
+
+    def get_cache_settings(self):
+        return self.voiceModule.get_cache_settings()
+
+    def get_key(self, text) -> Optional[str]:
+        settings = self.voiceModule.get_cache_settings()
+        if settings is None:
+            return None
+        return self.cache.get_key(type(self.voiceModule).__name__, settings, text)
+
+    def generate_voice(self, text, outputfile):
+        return self.generate_voice_with_timings(text, outputfile)[0]
+
+    def generate_voice_with_timings(self, text, outputfile):
+        key = self.get_key(text)
+        if key is None:
+            return self.voiceModule.generate_voice_with_timings(text, outputfile)
+        cached = self.cache.get(key, outputfile)
+        if cached:
+            return cached
+        self._unlink_output(outputfile)
+        outputfile, word_timings = self.voiceModule.generate_voice_with_timings(text, outputfile)
+        self._put(key, outputfile, word_timings)
+        return outputfile, word_timings
+
+    def generate_voices(self, texts_and_files):
+        return [outputfile for outputfile, _ in self.generate_voices_with_timings(texts_and_files)]
+
+    def generate_voices_with_timings(self, texts_and_files):
+        results = [None] * len(texts_and_files)
+        missing = []
+        for i, (text, outputfile) in enumerate(texts_and_files):
+            key = self.get_key(text)
+            cached = self.cache.get(key, outputfile) if key else None
+            if cached:
+                results[i] = cached
+            else:
+                self._unlink_output(outputfile)
+                missing.append((i, key, text, outputfile))
+        if missing:
+            # Generated with their word timings, so that they are cached along with the voices
+            generated = self.voiceModule.generate_voices_with_timings([(text, outputfile) for _, _, text, outputfile in missing])
+            for (i, key, _, _), (outputfile, word_timings) in zip(missing, generated):
+                if key:
+                    self._put(key, outputfile, word_timings)
+                results[i] = (outputfile, word_timings)
+        return results
+
+    def _put(self, key, outputfile, word_timings=None):
+        if not outputfile or not os.path.exists(outputfile):
+            return
+        try:
+            self.cache.put(key, outputfile, word_timings)
+        except Exception as e:
+            print(f"Failed to cache the voice {outputfile}. Error : {str(e)}")
+
+    def _unlink_output(self, outputfile):
+        # Removed before generating, so that a failed generation never leaves the audio of another text behind
+        if os.path.exists(outputfile):
+            os.remove(outputfile)
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 class VoiceModule(ABC):
+    # Voices synthesized at the same time by batch generations, see audio_utils.generateTimedVoiceBlocks
+    max_concurrency = 1
 
     def __init__(self):
         pass
@@ -13,4 +15,20 @@ class VoiceModule(ABC):
 
     @abstractmethod
     def generate_voice(self,text, outputfile):
-        pass
\ No newline at end of file
+        pass
+
+    def generate_voice_with_timings(self, text, outputfile):
+        # Voice modules that know when each word is spoken return [{'text', 'start', 'end'}] with the audio file, None otherwise
+        return self.generate_voice(text, outputfile), None
+
+    def get_cache_settings(self):
+        # Everything besides the text that changes the generated audio (voice, model, ...), None when the voices can't be cached
+        return None
+
+    def generate_voices(self, texts_and_files):
+        # Batch of (text, outputfile), voice modules able to stream several voices at once override it
+        return [self.generate_voice(text, outputfile) for text, outputfile in texts_and_files]
+
+    def generate_voices_with_timings(self, texts_and_files):
+        # Batch of (text, outputfile), returns the (outputfile, word_timings) of generate_voice_with_timings for each one
+        return [self.generate_voice_with_timings(text, outputfile) for text, outputfile in texts_and_files]
@@ -0,0 +1,146 @@
+import gc
+import threading
+import time
+from contextlib import contextmanager
+from typing import List
+
+# Seconds a loaded model stays in memory without being used, None keeps the models loaded
+WHISPER_IDLE_TIMEOUT = 15 * 60
+DEFAULT_WHISPER_MODEL = 'base'
+
+
+class WhisperModelPool:
+    """
+    Thread-safe pool of whisper_timestamped models, keyed by model size and device.
+    Each model is loaded once, by the first caller asking for it or by warm_up on a
+    background thread. A model is used by one transcription at a time, since
+    whisper_timestamped hooks into the model while it transcribes. Models unused for
+    idle_timeout seconds are unloaded by a background thread.
+    """
+
+    def __init__(self, idle_timeout=WHISPER_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._models = {}
+        self._last_used = {}
+        self._model_locks = {}
+        self._lock = threading.Lock()
+        self._evictor = None
+
+    def get_key(self, model_size=DEFAULT_WHISPER_MODEL, device=None):
+        return (model_size, device)
+
+    def _get_model_lock(self, key) -> threading.Lock:
+        with self._lock:
+            if key not in self._model_locks:
+                self._model_locks[key] = threading.Lock()
+            return self._model_locks[key]
+
+    def _load(self, key):
+        # Called with the lock of the model held, so that a model is never loaded twice
+        with self._lock:
+            if key in self._models:
+                return self._models[key]
+        from whisper_timestamped import load_model
+        model_size, device = key
+        model = load_model(model_size, device=device)
+        with self._lock:
+            self._models[key] = model
+            self._last_used[key] = time.monotonic()
+        self._start_evictor()
+        return model
+
+    @contextmanager
+    def use_model(self, model_size=DEFAULT_WHISPER_MODEL, device=None):
+        """Yields the model of model_size on device, loading it when needed, for the exclusive use of the caller."""
+        key = self.get_key(model_size, device)
+        with self._get_model_lock(key):
+            model = self._load(key)
+            try:
+                yield model
+            finally:
+                with self._lock:
+                    self._last_used[key] = time.monotonic()
+
+    def warm_up(self, model_sizes: List[str] = None, device=None) -> threading.Thread:
+        """Loads the models on a background thread, so that the first transcription doesn't wait for them."""
+        model_sizes = model_sizes or [DEFAULT_WHISPER_MODEL]
+
+        def load_models():
+            for model_size in model_sizes:
+                key = self.get_key(model_size, device)
+                try:
+                    with self._get_model_lock(key):
+                        self._load(key)
+                except Exception as e:
+                    print(f"Failed to warm up the whisper model {model_size}. Error : {str(e)}")
+
+        thread = threading.Thread(target=load_models, name='whisper-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def evict_idle(self) -> List[str]:
+        """Unloads the models unused for idle_timeout seconds, and returns their sizes."""
+        if self.idle_timeout is None:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            idle_keys = [key for key, last_used in self._last_used.items() if now - last_used > self.idle_timeout]
+            model_locks = [(key, self._model_locks[key]) for key in idle_keys]
+        evicted = []
+        for key, model_lock in model_locks:
+            # A model being used isn't idle, it is checked again on the next run
+            if not model_lock.acquire(blocking=False):
+                continue
+            try:
+                with self._lock:
+                    if key in self._models and now - self._last_used[key] > self.idle_timeout:
+                        del self._models[key]
+                        del self._last_used[key]
+                        evicted.append(key[0])
+            finally:
+                model_lock.release()
+        if evicted:
+            self._release_memory()
+        return evicted
+
+    def unload(self):
+        with self._lock:
+            self._models.clear()
+            self._last_used.clear()
+        self._release_memory()
+
+    def get_loaded_models(self) -> List[tuple]:
+        with self._lock:
+            return list(self._models)
+
+    def _release_memory(self):
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+    def _start_evictor(self):
+        with self._lock:
+            if self.idle_timeout is None or (self._evictor and self._evictor.is_alive()):
+                return
+            self._evictor = threading.Thread(target=self._run_evictor, name='whisper-eviction', daemon=True)
+            self._evictor.start()
+
+    def _run_evictor(self):
+        while True:
+            idle_timeout = self.idle_timeout
+            if idle_timeout is None:
+                return
+            time.sleep(min(max(idle_timeout / 4, 1), 60))
+            self.evict_idle()
+            with self._lock:
+                if not self._models:
+                    # Restarted by the next load
+                    self._evictor = None
+                    return
+
+
+WHISPER_MODEL_POOL = WhisperModelPool()
@@ -0,0 +1,73 @@
+import json
+import time
+
+from shortGPT.editing_framework.editing_engine import (EDITING_TEMPLATE_REGISTRY, STEPS_PATH, EditingEngine,
+                                                       EditingStep)
+
+# Caption blocks of a typical translated video
+N_CAPTIONS = 300
+
+
+def legacy_add_editing_step(engine: EditingEngine, editingStep: EditingStep, args):
+    # addEditingStep before the template registry: the step file is parsed and scanned on every call
+    json_step = json.loads(
+        open(STEPS_PATH / f"{editingStep.value}", 'r', encoding='utf-8').read())
+    step_name, editingStepDict = list(json_step.items())[0]
+    if 'inputs' in editingStepDict:
+        required_args = (editingStepDict['inputs']['actions'] if 'actions' in editingStepDict['inputs'] else []) + (editingStepDict['inputs']['parameters'] if 'parameters' in editingStepDict['inputs'] else [])
+        for required_argument in required_args:
+            if required_argument not in args:
+                raise Exception(
+                    f"Error. '{required_argument}' input missing, you must include it to use this editing step")
+        action_names = [action['type'] for action in editingStepDict['actions']
+                        ] if 'actions' in editingStepDict else []
+        param_names = [param_name for param_name in editingStepDict['parameters']
+                       ] if 'parameters' in editingStepDict else []
+        for arg_name in args:
+            if 'parameters' in editingStepDict['inputs'] and arg_name in param_names:
+                editingStepDict['parameters'][arg_name] = args[arg_name]
+            if 'actions' in editingStepDict['inputs'] and arg_name in action_names:
+                for i, action in enumerate(editingStepDict['actions']):
+                    if action['type'] == arg_name:
+                        editingStepDict['actions'][i]['param'] = args[arg_name]
+    if editingStepDict['type'] == 'audio':
+        engine.schema['audio_assets'][f"{step_name}_{engine.editing_step_tracker[editingStep]}"] = editingStepDict
+    else:
+        engine.schema['visual_assets'][f"{step_name}_{engine.editing_step_tracker[editingStep]}"] = editingStepDict
+    engine.editing_step_tracker[editingStep] += 1
+
+
+def build_caption_schema(add_step):
+    engine = EditingEngine()
+    add_step(engine, EditingStep.ADD_BACKGROUND_VIDEO, {'url': 'background.mp4', 'set_time_start': 0, 'set_time_end': N_CAPTIONS})
+    add_step(engine, EditingStep.ADD_VOICEOVER_AUDIO, {'url': 'voiceover.wav'})
+    add_step(engine, EditingStep.ADD_BACKGROUND_MUSIC, {'url': 'music.wav', 'loop_background_music': N_CAPTIONS, 'volume_percentage': 0.11})
+    for i in range(N_CAPTIONS):
+        add_step(engine, EditingStep.ADD_CAPTION_SHORT, {'text': f"caption number {i}", 'set_time_start': i, 'set_time_end': i + 1})
+    return engine.dumpEditingSchema()
+
+
+def time_calls(add_step, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        build_caption_schema(add_step)
+    elapsed = time.perf_counter() - start
+    return repeat * (N_CAPTIONS + 3) / elapsed
+
+
+def run(repeat=20):
+    registry_add_step = lambda engine, step, args: engine.addEditingStep(step, args)
+    EDITING_TEMPLATE_REGISTRY.load()
+    if build_caption_schema(legacy_add_editing_step) != build_caption_schema(registry_add_step):
+        raise Exception("Error. The template registry and the legacy addEditingStep built different schemas")
+    legacy_rate = time_calls(legacy_add_editing_step, repeat)
+    registry_rate = time_calls(registry_add_step, repeat)
+    print(f"addEditingStep, {N_CAPTIONS} captions per schema")
+    print(f"legacy (parse per call) : {legacy_rate:,.0f} steps/s")
+    print(f"template registry       : {registry_rate:,.0f} steps/s")
+    print(f"speedup                 : x{registry_rate / legacy_rate:.1f}")
+    return {'legacy_steps_per_second': legacy_rate, 'registry_steps_per_second': registry_rate}
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,303 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARK_DIR = '.editing_assets/benchmarks/'
+MEDIA_DIR = BENCHMARK_DIR + 'media/'
+BASELINE_PATH = BENCHMARK_DIR + 'baseline.json'
+DURATION = 10
+# Relative increase of a metric over the baseline reported as a regression
+REGRESSION_THRESHOLD = 0.1
+PROCESS_SAMPLING_INTERVAL = 0.05
+COMPARED_METRICS = ['wall_time', 'peak_rss_mb', 'peak_ffmpeg_processes']
+
+DEFAULT_SCENARIO = {'operation': 'render_video', 'clips': 1, 'captions': 0, 'images': 0, 'music': False, 'green_screen': False}
+SCENARIOS = {
+    'captions': {'captions': 40},
+    'background_clips': {'clips': 4},
+    'images': {'images': 5},
+    'music_loop': {'music': True},
+    'green_screen': {'green_screen': True},
+    'full_short': {'clips': 2, 'captions': 20, 'images': 3, 'music': True, 'green_screen': True},
+    'thumbnail': {'operation': 'render_image', 'clips': 0, 'captions': 1, 'images': 1},
+    'audio_mix': {'operation': 'generate_audio', 'clips': 0, 'music': True},
+}
+
+
+def run_ffmpeg(args, output_file):
+    if os.path.exists(output_file):
+        return output_file
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    tmp_path = f"{os.path.splitext(output_file)[0]}.tmp{os.path.splitext(output_file)[1]}"
+    command = ['ffmpeg', '-y', '-loglevel', 'error'] + args + [tmp_path]
+    output = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if output.returncode != 0:
+        raise Exception(f"Error generating the benchmark media {output_file} using ffmpeg. {output.stderr.strip()}")
+    os.replace(tmp_path, output_file)
+    return output_file
+
+
+def generate_media(duration=DURATION, media_dir=MEDIA_DIR):
+    # Synthetic sources made with the lavfi test sources, generated once per duration
+    media = {
+        'background': run_ffmpeg(['-f', 'lavfi', '-i', f"testsrc=size=1080x1920:rate=30:duration={duration}",
+                                  '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p'],
+                                 os.path.join(media_dir, f"background_{duration}s.mp4")),
+        'voiceover': run_ffmpeg(['-f', 'lavfi', '-i', f"sine=frequency=440:duration={duration}", '-ac', '1', '-ar', '24000'],
+                                os.path.join(media_dir, f"voiceover_{duration}s.wav")),
+        # Shorter than the video, so that the background music is looped
+        'music': run_ffmpeg(['-f', 'lavfi', '-i', f"sine=frequency=220:duration={max(duration / 3, 1)}", '-ac', '2', '-ar', '44100'],
+                            os.path.join(media_dir, f"music_{duration}s.wav")),
+        'image': run_ffmpeg(['-f', 'lavfi', '-i', 'testsrc=size=1280x720', '-frames:v', '1'],
+                            os.path.join(media_dir, 'image.png')),
+        'green_screen': run_ffmpeg(['-f', 'lavfi', '-i', f"color=c=0x00ff00:size=1280x720:rate=30:duration={duration}",
+                                    '-f', 'lavfi', '-i', f"testsrc=size=480x270:rate=30:duration={duration}",
+                                    '-filter_complex', 'overlay=400:225', '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p'],
+                                   os.path.join(media_dir, f"green_screen_{duration}s.mp4")),
+    }
+    return media
+
+
+def build_engine(media, scenario, duration=DURATION):
+    from shortGPT.editing_framework.editing_engine import EditingEngine, EditingStep
+    engine = EditingEngine()
+    if scenario['operation'] != 'render_image':
+        engine.addEditingStep(EditingStep.ADD_VOICEOVER_AUDIO, {'url': media['voiceover']})
+    if scenario['music']:
+        engine.addEditingStep(EditingStep.ADD_BACKGROUND_MUSIC, {'url': media['music'],
+                                                                 'loop_background_music': duration,
+                                                                 'volume_percentage': 0.11})
+    for i in range(scenario['clips']):
+        clip_duration = duration / scenario['clips']
+        engine.addEditingStep(EditingStep.ADD_BACKGROUND_VIDEO, {'url': media['background'],
+                                                                 'set_time_start': i * clip_duration,
+                                                                 'set_time_end': (i + 1) * clip_duration})
+    if scenario['green_screen']:
+        engine.addEditingStep(EditingStep.ADD_SUBSCRIBE_ANIMATION, {'url': media['green_screen']})
+    for i in range(scenario['images']):
+        image_duration = duration / scenario['images']
+        engine.addEditingStep(EditingStep.SHOW_IMAGE, {'url': media['image'],
+                                                       'set_time_start': i * image_duration,
+                                                       'set_time_end': (i + 1) * image_duration})
+    for i in range(scenario['captions']):
+        caption_duration = duration / scenario['captions']
+        engine.addEditingStep(EditingStep.ADD_CAPTION_SHORT, {'text': f"CAPTION {i}",
+                                                              'set_time_start': i * caption_duration,
+                                                              'set_time_end': (i + 1) * caption_duration})
+    return engine
+
+
+def count_ffmpeg_processes(root_pid):
+    # Processes named ffmpeg descending from root_pid, None where /proc isn't available
+    if not os.path.isdir('/proc'):
+        return None
+    parents, names = {}, {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The process name is between parentheses and may contain spaces
+        name = stat[stat.index('(') + 1:stat.rindex(')')]
+        parents[int(entry)] = int(stat[stat.rindex(')') + 2:].split()[1])
+        names[int(entry)] = name
+    ffmpeg_pids = set()
+    for pid, name in names.items():
+        if 'ffmpeg' not in name:
+            continue
+        parent = parents.get(pid)
+        while parent and parent != root_pid:
+            parent = parents.get(parent)
+        if parent == root_pid:
+            ffmpeg_pids.add(pid)
+    return ffmpeg_pids
+
+
+class ProcessSampler:
+    """Samples the ffmpeg processes started by the current process while a benchmark runs."""
+
+    def __init__(self, interval=PROCESS_SAMPLING_INTERVAL):
+        self.interval = interval
+        self.peak_processes = 0
+        self.spawned_pids = set()
+        self.available = os.path.isdir('/proc')
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            pids = count_ffmpeg_processes(os.getpid())
+            if pids is None:
+                return
+            self.peak_processes = max(self.peak_processes, len(pids))
+            self.spawned_pids |= pids
+            self._stopped.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+
+def run_scenario(name, scenario, media, duration, result_queue):
+    # Runs in a fresh process, so that the peak RSS and the caches only reflect this scenario
+    from shortGPT.editing_framework.encoder_profile import get_encoder_profile
+    from shortGPT.editing_framework.keyed_overlay_cache import KEYED_OVERLAY_CACHE
+    from shortGPT.editing_framework.text_sprite_cache import TEXT_SPRITE_CACHE
+    try:
+        with tempfile.TemporaryDirectory(prefix='shortgpt_benchmark_') as work_dir:
+            TEXT_SPRITE_CACHE.cache_dir = os.path.join(work_dir, 'text_sprites/')
+            KEYED_OVERLAY_CACHE.cache_dir = os.path.join(work_dir, 'keyed_overlays/')
+            engine = build_engine(media, scenario, duration)
+            operation = scenario['operation']
+            with ProcessSampler() as sampler:
+                start = time.perf_counter()
+                if operation == 'render_video':
+                    engine.renderVideo(os.path.join(work_dir, 'video.mp4'), use_cache=False)
+                elif operation == 'render_image':
+                    engine.renderImage(os.path.join(work_dir, 'image.png'))
+                elif operation == 'generate_audio':
+                    engine.generateAudio(os.path.join(work_dir, 'audio.wav'))
+                else:
+                    raise ValueError(f"Invalid benchmark operation: {operation}")
+                wall_time = time.perf_counter() - start
+        # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+        rss_unit = 1024 ** 2 if sys.platform == 'darwin' else 1024
+        result = {
+            'operation': operation,
+            'wall_time': wall_time,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / rss_unit,
+            'peak_child_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / rss_unit,
+            'peak_ffmpeg_processes': sampler.peak_processes if sampler.available else None,
+            'ffmpeg_processes_spawned': len(sampler.spawned_pids) if sampler.available else None,
+        }
+        if operation == 'render_video':
+            result['fps'] = duration * get_encoder_profile().fps / wall_time
+        result_queue.put((name, result, None))
+    except Exception as e:
+        result_queue.put((name, None, f"{type(e).__name__}: {e}"))
+
+
+def benchmark_scenario(name, media, duration=DURATION, repeat=1):
+    scenario = dict(DEFAULT_SCENARIO, **SCENARIOS[name])
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    for _ in range(repeat):
+        result_queue = context.Queue()
+        process = context.Process(target=run_scenario, args=(name, scenario, media, duration, result_queue))
+        process.start()
+        _, result, error = result_queue.get()
+        process.join()
+        if error:
+            raise Exception(f"Error. Benchmark scenario '{name}' failed: {error}")
+        runs.append(result)
+    # The median run is reported, the other metrics come from the same run
+    runs.sort(key=lambda run: run['wall_time'])
+    result = dict(runs[len(runs) // 2])
+    result['wall_times'] = [run['wall_time'] for run in runs]
+    result['scenario'] = scenario
+    return result
+
+
+def run(scenarios=None, duration=DURATION, repeat=1, output_file=None):
+    scenarios = scenarios or list(SCENARIOS)
+    for name in scenarios:
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown benchmark scenario '{name}', choose one of {list(SCENARIOS.keys())}")
+    import moviepy
+    media = generate_media(duration)
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'moviepy': moviepy.__version__,
+        },
+        'duration': duration,
+        'results': {},
+    }
+    for name in scenarios:
+        result = benchmark_scenario(name, media, duration, repeat)
+        report['results'][name] = result
+        fps = f"{result['fps']:6.1f} fps" if 'fps' in result else ' ' * 10
+        print(f"{name:<18} {result['operation']:<15} {result['wall_time']:7.2f}s {fps} "
+              f"{result['peak_rss_mb']:7.0f} MB  ffmpeg peak {result['peak_ffmpeg_processes']}, spawned {result['ffmpeg_processes_spawned']}")
+    if output_file:
+        if os.path.dirname(output_file):
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def compare(baseline, report, threshold=REGRESSION_THRESHOLD):
+    """Prints the change of every metric of report over baseline, and returns the regressions."""
+    regressions = []
+    for name, result in report['results'].items():
+        if name not in baseline['results']:
+            print(f"{name:<18} not in the baseline")
+            continue
+        baseline_result = baseline['results'][name]
+        changes = []
+        for metric in COMPARED_METRICS:
+            old, new = baseline_result.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            changes.append(f"{metric} {old:.2f} -> {new:.2f} ({change:+.1%})")
+            if change > threshold:
+                regressions.append({'scenario': name, 'metric': metric, 'baseline': old, 'value': new, 'change': change})
+        print(f"{name:<18} " + ', '.join(changes))
+    if baseline.get('environment') != report.get('environment'):
+        print(f"Warning: the baseline was measured in another environment {baseline.get('environment')}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic render benchmarks of the editing framework")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="Run the benchmark scenarios and report them as JSON")
+    run_parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), help="Scenarios to run, all by default")
+    run_parser.add_argument('--duration', type=float, default=DURATION, help="Duration of the rendered videos, in seconds")
+    run_parser.add_argument('--repeat', type=int, default=1, help="Runs of each scenario, the median one is reported")
+    run_parser.add_argument('--output', help="JSON file the report is written to")
+    run_parser.add_argument('--save-baseline', action='store_true', help=f"Also store the report as the baseline ({BASELINE_PATH})")
+    compare_parser = commands.add_parser('compare', help="Compare a JSON report with the baseline")
+    compare_parser.add_argument('report', help="JSON report written by the run command")
+    compare_parser.add_argument('--baseline', default=BASELINE_PATH, help="Baseline JSON report")
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help="Relative increase reported as a regression")
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run(args.scenarios, args.duration, args.repeat, args.output)
+        if args.save_baseline:
+            os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+            with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.report, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    regressions = compare(baseline, report, args.threshold)
+    for regression in regressions:
+        print(f"Regression: {regression['scenario']} {regression['metric']} {regression['change']:+.1%}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
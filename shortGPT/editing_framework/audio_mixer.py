@@ -0,0 +1,205 @@
+import os
+import subprocess
+import tempfile
+from typing import Any, Dict, List
+
+import numpy as np
+from moviepy import AudioClip
+
+AUDIO_FPS = 44100
+AUDIO_CHANNELS = 2
+# Decoded sources larger than this are spilled to a memory-mapped PCM file instead of being kept in memory
+MAX_IN_MEMORY_SOURCE_SIZE = 256 * 1024 ** 2
+DECODE_CHUNK_SIZE = 4 * 1024 ** 2
+
+
+class MixedAudioClip(AudioClip):
+    """
+    Audio clip summing the tracks of an AudioMixer.
+    Each track is a window of a decoded source placed on the timeline, the samples of a
+    chunk are gathered with vectorized indexing, the same way moviepy's CompositeAudioClip
+    reads its AudioFileClips, but without any ffmpeg reader process per track.
+    """
+
+    def __init__(self, mixer: 'AudioMixer', tracks: List[Dict[str, Any]]):
+        self.mixer = mixer
+        self.tracks = tracks
+        duration = max((track['end'] for track in tracks), default=0)
+        super().__init__(self.mix, duration=duration, fps=AUDIO_FPS)
+
+    def mix(self, t):
+        tt = np.atleast_1d(np.asarray(t, dtype=np.float64))
+        sound = np.zeros((len(tt), AUDIO_CHANNELS), dtype=np.float32)
+        if len(tt):
+            t_min, t_max = tt.min(), tt.max()
+            for track in self.tracks:
+                if track['gain'] == 0 or track['end'] < t_min or track['start'] > t_max:
+                    continue
+                self.add_track(sound, tt, track)
+        return sound if np.ndim(t) else sound[0]
+
+    def add_track(self, sound, tt, track):
+        # Same time window as moviepy's Clip.is_playing, and same sample lookup as its audio reader
+        playing = np.nonzero((tt >= track['start']) & (tt <= track['end']))[0]
+        local_t = tt[playing] - track['start']
+        if track['loop_duration']:
+            local_t = np.mod(local_t, track['loop_duration'])
+        source = track['source']
+        indices = np.round((local_t + track['offset']) * AUDIO_FPS).astype(np.int64)
+        in_source = (indices >= 0) & (indices < len(source))
+        sound[playing[in_source]] += source[indices[in_source]] * track['gain']
+
+    def close(self):
+        self.mixer.close()
+        super().close()
+
+
+class AudioMixer:
+    """
+    Mixes the audio assets of an editing schema with numpy.
+    Every source file is decoded once, by a single ffmpeg process, into a float32 array
+    (memory-mapped when it is long), however many assets use it, e.g. the source video
+    audio extracted between every translated speech block. subclip, start/end times,
+    volume, normalization and loops are then applied to the decoded samples, and the
+    mix is rendered chunk by chunk by moviepy's audio writer.
+    """
+
+    def __init__(self):
+        self._sources = {}
+        self._spill_files = []
+
+    def build_clip(self, schema: Dict[str, Any]) -> MixedAudioClip:
+        audio_assets = dict(sorted(schema['audio_assets'].items(), key=lambda item: item[1]['z']))
+        tracks = []
+        for asset_key in audio_assets:
+            asset = audio_assets[asset_key]
+            asset_type = asset['type']
+            if asset_type == "audio":
+                tracks.append(self.process_audio_asset(asset))
+            else:
+                raise ValueError(f"Invalid asset type: {asset_type}")
+        return MixedAudioClip(self, tracks)
+
+    def process_audio_asset(self, asset: Dict[str, Any]) -> Dict[str, Any]:
+        source = self.decode(asset['parameters']['url'])
+        track = self.new_track(source)
+        return self.process_audio_actions(track, asset['actions'])
+
+    def new_track(self, source):
+        duration = len(source) / AUDIO_FPS
+        return {
+            'source': source,
+            'start': 0,
+            'end': duration,
+            'duration': duration,
+            'offset': 0,
+            'loop_duration': None,
+            'gain': 1.0,
+        }
+
+    def process_common_actions(self, track: Dict[str, Any], actions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        for action in actions:
+            if action['type'] == 'set_time_start':
+                track['start'] = action['param']
+                track['end'] = track['start'] + track['duration']
+                continue
+
+            if action['type'] == 'set_time_end':
+                track['end'] = action['param']
+                track['duration'] = track['end'] - track['start']
+                continue
+
+            if action['type'] == 'subclip':
+                start_time = action['param'].get('start_time', 0)
+                end_time = action['param'].get('end_time')
+                if end_time is None:
+                    end_time = track['duration']
+                track['offset'] += start_time
+                track['duration'] = end_time - start_time
+                track['end'] = track['start'] + track['duration']
+                continue
+
+        return track
+
+    def process_audio_actions(self, track: Dict[str, Any], actions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        track = self.process_common_actions(track, actions)
+        for action in actions:
+            if action['type'] == 'normalize_music':
+                max_volume = self.get_max_volume(track)
+                if max_volume > 0:
+                    track['gain'] /= max_volume
+                continue
+
+            if action['type'] == 'loop_background_music':
+                target_duration = action['param']
+                start = track['duration'] * 0.15
+                track['offset'] += start
+                track['loop_duration'] = track['duration'] - start
+                track['duration'] = target_duration
+                track['end'] = track['start'] + target_duration
+                continue
+
+            if action['type'] == 'volume_percentage':
+                track['gain'] *= action['param']
+                continue
+
+        return track
+
+    def get_max_volume(self, track: Dict[str, Any]) -> float:
+        source = track['source']
+        first = max(int(round(track['offset'] * AUDIO_FPS)), 0)
+        last = min(int(round((track['offset'] + track['duration']) * AUDIO_FPS)) + 1, len(source))
+        if last <= first:
+            return 0
+        max_volume = 0
+        for chunk_start in range(first, last, AUDIO_FPS * 60):
+            chunk = source[chunk_start:min(chunk_start + AUDIO_FPS * 60, last)]
+            max_volume = max(max_volume, float(np.abs(chunk).max()) * abs(track['gain']))
+        return max_volume
+
+    def decode(self, url) -> np.ndarray:
+        if url in self._sources:
+            return self._sources[url]
+        command = ['ffmpeg', '-v', 'error', '-i', url, '-vn', '-f', 'f32le', '-acodec', 'pcm_f32le',
+                   '-ac', str(AUDIO_CHANNELS), '-ar', str(AUDIO_FPS), '-']
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        chunks, size, spill_file, spill_path = [], 0, None, None
+        try:
+            for chunk in iter(lambda: process.stdout.read(DECODE_CHUNK_SIZE), b''):
+                size += len(chunk)
+                if spill_file is None and size > MAX_IN_MEMORY_SOURCE_SIZE:
+                    # Long source, the decoded samples go to disk and are memory-mapped
+                    fd, spill_path = tempfile.mkstemp(prefix='shortgpt_pcm_', suffix='.f32')
+                    self._spill_files.append(spill_path)
+                    spill_file = os.fdopen(fd, 'wb')
+                    spill_file.writelines(chunks)
+                    chunks = []
+                if spill_file is not None:
+                    spill_file.write(chunk)
+                else:
+                    chunks.append(chunk)
+        finally:
+            if spill_file is not None:
+                spill_file.close()
+            stderr = process.stderr.read()
+            process.wait()
+        if process.returncode != 0:
+            raise Exception(f"Error decoding {url} using ffmpeg. {stderr.decode('utf-8', 'replace').strip()}")
+
+        frame_size = AUDIO_CHANNELS * 4
+        n_frames = size // frame_size
+        if spill_path is not None:
+            source = np.memmap(spill_path, dtype=np.float32, mode='r', shape=(n_frames, AUDIO_CHANNELS))
+        else:
+            source = np.frombuffer(b''.join(chunks)[:n_frames * frame_size], dtype=np.float32).reshape(n_frames, AUDIO_CHANNELS)
+        self._sources[url] = source
+        return source
+
+    def close(self):
+        self._sources.clear()
+        for spill_path in self._spill_files:
+            try:
+                os.remove(spill_path)
+            except OSError:
+                pass
+        self._spill_files = []
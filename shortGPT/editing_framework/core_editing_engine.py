@@ -8,204 +8,320 @@ from moviepy import (AudioFileClip, CompositeVideoClip, CompositeAudioClip, Imag
                     TextClip, VideoFileClip, AudioClip)
 from moviepy.Clip import Clip
 from moviepy import vfx, afx
-from shortGPT.editing_framework.rendering_logger import MoviepyProgressLogger
+from shortGPT.editing_framework.audio_mixer import AudioMixer
+from shortGPT.editing_framework.rendering_logger import get_progress_logger
+from shortGPT.editing_framework.encoder_profile import get_encoder_profile
+from shortGPT.editing_framework.media_reader_pool import MEDIA_READER_POOL
+from shortGPT.editing_framework.schema_compiler import CompiledLayer, SchemaCompiler
+from shortGPT.editing_framework.keyed_overlay_cache import KEYED_OVERLAY_CACHE, split_prekeyable_actions
+from shortGPT.editing_framework.text_sprite_cache import TEXT_SPRITE_CACHE
+from shortGPT.editing_framework.transform_fusion import CropResize, fuse_geometric_actions
 import json
 
 def load_schema(json_path):
     return json.loads(open(json_path, 'r', encoding='utf-8').read())
 
+
+def normalize_frame(frame):
+    frame = np.asarray(frame)
+    if frame.ndim == 2:
+        frame = frame[:, :, np.newaxis]
+    if frame.shape[2] < 3:
+        frame = np.broadcast_to(frame[:, :, :1], frame.shape[:2] + (3,))
+    return np.ascontiguousarray(frame, dtype=np.uint8)
+
+
+def normalize_image_clip(clip):
+    def f(get_frame, t):
+        if f.normalized_frame is None:
+            f.normalized_frame = normalize_frame(get_frame(t))
+        return f.normalized_frame
+
+    f.normalized_frame = None
+
+    return clip.transform(f)
+
+
+def set_time_start(clip, param):
+    return clip.with_start(param)
+
+
+def set_time_end(clip, param):
+    return clip.with_end(param)
+
+
+def subclip(clip, param):
+    return clip.subclipped(**param)
+
+
+def crop_resize(clip, param):
+    return clip.with_effects([CropResize(**param)])
+
+
+def resize(clip, param):
+    return clip.with_effects([vfx.Resize(**param)])
+
+
+def crop(clip, param):
+    return clip.with_effects([vfx.Crop(**param)])
+
+
+def screen_position(clip, param):
+    return clip.with_position(**param)
+
+
+def green_screen(clip, param):
+    color = param['color'] if param['color'] else [52, 255, 20]
+    thr = param["threshold"] if param["threshold"] else 100
+    s = param['stiffness'] if param['stiffness'] else 5
+    return clip.with_effects([vfx.MaskColor(color=color, threshold=thr, stiffness=s)])
+
+
+def normalize_image(clip, param):
+    if isinstance(clip, ImageClip):
+        return normalize_image_clip(clip)
+    return clip.image_transform(normalize_frame)
+
+
+def auto_resize_image(clip, param):
+    ar = clip.aspect_ratio
+    height = param['maxHeight']
+    width = param['maxWidth']
+    if ar < 1:
+        return clip.with_effects([vfx.Resize((height*ar, height))])
+    return clip.with_effects([vfx.Resize((width, width/ar))])
+
+
+def normalize_music(clip, param):
+    return clip.with_effects([afx.AudioNormalize()])
+
+
+def loop_background_music(clip, param):
+    start = clip.duration * 0.15
+    clip = clip.subclipped(start)
+    return clip.with_effects([afx.AudioLoop(duration=param)])
+
+
+def volume_percentage(clip, param):
+    return clip.with_effects([afx.MultiplyVolume(param)])
+
+
+# Actions of every clip, applied first in the order of the asset actions. Action types missing from a table are ignored
+COMMON_ACTIONS = {
+    'set_time_start': set_time_start,
+    'set_time_end': set_time_end,
+    'subclip': subclip,
+}
+# Actions of visual clips, applied after the common actions, once crop and resize chains are fused
+VISUAL_ACTIONS = {
+    'crop_resize': crop_resize,
+    'resize': resize,
+    'crop': crop,
+    'screen_position': screen_position,
+    'green_screen': green_screen,
+    'normalize_image': normalize_image,
+    'auto_resize_image': auto_resize_image,
+}
+# Actions of audio clips, applied after the common actions
+AUDIO_ACTIONS = {
+    'normalize_music': normalize_music,
+    'loop_background_music': loop_background_music,
+    'volume_percentage': volume_percentage,
+}
+
+
+def apply_actions(clip, actions: List[Dict[str, Any]], action_table: Dict[str, Any]):
+    for action in actions:
+        apply_action = action_table.get(action['type'])
+        if apply_action is not None:
+            clip = apply_action(clip, action.get('param'))
+    return clip
+
+
+class LayerIntervalIndex:
+    """
+    Sweep-line index over the [start, end) windows of a list of clips.
+    Frames are rendered with increasing t, so each call only moves the sweep forward:
+    clips whose start has been reached join the active set, ended clips leave it,
+    and the work per frame depends on the number of visible clips, not on the total.
+    Going back in time rebuilds the active set from scratch. on_clip_end is called with
+    each clip leaving the active set.
+    """
+
+    def __init__(self, clips, on_clip_end=None):
+        self.clips = clips
+        self.on_clip_end = on_clip_end
+        self.start_order = sorted(range(len(clips)), key=lambda i: clips[i].start)
+        self.reset()
+
+    def reset(self):
+        self.next_start = 0
+        self.active = set()
+        self.last_t = None
+
+    def playing_clips(self, t=0):
+        if self.last_t is not None and t < self.last_t:
+            self.reset()
+        self.last_t = t
+        while self.next_start < len(self.start_order) and self.clips[self.start_order[self.next_start]].start <= t:
+            self.active.add(self.start_order[self.next_start])
+            self.next_start += 1
+        ended = [i for i in self.active if self.clips[i].end is not None and self.clips[i].end <= t]
+        self.active.difference_update(ended)
+        if self.on_clip_end:
+            for i in ended:
+                self.on_clip_end(self.clips[i])
+        # Keep the layer order of the composition
+        return [self.clips[i] for i in sorted(self.active)]
+
+
+class IndexedCompositeVideoClip(CompositeVideoClip):
+    """CompositeVideoClip finding the clips playing at time t through a LayerIntervalIndex."""
+
+    def __init__(self, clips, size=None, bg_color=None, use_bgclip=False, is_mask=False):
+        super().__init__(clips, size=size, bg_color=bg_color, use_bgclip=use_bgclip, is_mask=is_mask)
+        # Video readers are closed as soon as their layer ends
+        self.interval_index = LayerIntervalIndex(self.clips, on_clip_end=MEDIA_READER_POOL.release_clip)
+        if isinstance(self.mask, CompositeVideoClip) and not isinstance(self.mask, IndexedCompositeVideoClip):
+            self.mask = IndexedCompositeVideoClip(self.mask.clips, self.mask.size, is_mask=True, bg_color=0.0)
+
+    def playing_clips(self, t=0):
+        return self.interval_index.playing_clips(t)
+
+
 class CoreEditingEngine:
 
-    def generate_image(self, schema:Dict[str, Any],output_file , logger=None):
-        assets = dict(sorted(schema['visual_assets'].items(), key=lambda item: item[1]['z']))
-        clips = []
-
-        for asset_key in assets:
-            asset = assets[asset_key]
-            asset_type = asset['type']
-            if asset_type == 'image':
-                clip = self.process_image_asset(asset)
-            elif asset_type == 'text':
-                clip = self.process_text_asset(asset)
-                clips.append(clip)
-            else:
-                raise ValueError(f'Invalid asset type: {asset_type}')
-            clips.append(clip)
+    def __init__(self):
+        self._layer_builders = {
+            'video': self.process_video_layer,
+            'image': self.process_image_layer,
+            'text': self.process_text_layer,
+        }
 
+    def generate_image(self, schema:Dict[str, Any],output_file , logger=None):
+        visual_layers, _ = SchemaCompiler().compile_layers(schema, probe=False)
+        clips = [self.build_clip(layer) for layer in visual_layers]
         image = CompositeVideoClip(clips)
         image.save_frame(output_file)
         return output_file
 
-    def generate_video(self, schema:Dict[str, Any], output_file, logger=None, force_duration=None, threads=None) -> None:
-        visual_assets = dict(sorted(schema['visual_assets'].items(), key=lambda item: item[1]['z']))
-        audio_assets = dict(sorted(schema['audio_assets'].items(), key=lambda item: item[1]['z']))
-        
-        visual_clips = []
-        for asset_key in visual_assets:
-            asset = visual_assets[asset_key]
-            asset_type = asset['type']
-            if asset_type == 'video':
-                clip = self.process_video_asset(asset)
-            elif asset_type == 'image':
-                # clip = self.process_image_asset(asset)
-                try:
-                    clip = self.process_image_asset(asset)
-                except Exception as e:
-                    print(f"Failed to load image {asset['parameters']['url']}. Error : {str(e)}")
-                    continue
-            elif asset_type == 'text':
-                clip = self.process_text_asset(asset)
+    def generate_video(self, schema:Dict[str, Any], output_file, logger=None, force_duration=None, threads=None, encoder_profile=None) -> None:
+        encoder_profile = get_encoder_profile(encoder_profile)
+        video = self.build_video(schema, force_duration=force_duration)
+        fps, ffmpeg_params = self.get_output_settings(schema, video.size, encoder_profile)
+        encoder_settings = dict(threads=threads or encoder_profile.threads, codec=encoder_profile.codec, bitrate=encoder_profile.bitrate,
+                                audio_codec=encoder_profile.audio_codec, audio_bitrate=encoder_profile.audio_bitrate, fps=fps,
+                                preset=encoder_profile.preset, ffmpeg_params=ffmpeg_params)
+        try:
+            if logger:
+                my_logger = get_progress_logger(logger)
+                video.write_videofile(output_file, logger=my_logger, **encoder_settings)
             else:
-                raise ValueError(f'Invalid asset type: {asset_type}')
+                video.write_videofile(output_file, **encoder_settings)
+        finally:
+            if video.audio is not None:
+                video.audio.close()
+        return output_file
 
+    def get_output_settings(self, schema:Dict[str, Any], video_size, encoder_profile=None):
+        encoder_profile = get_encoder_profile(encoder_profile)
+        output = schema.get('output', {})
+        fps = output.get('fps') or encoder_profile.fps
+        ffmpeg_params = encoder_profile.get_video_params()
+        size = output.get('size')
+        if size and tuple(size) != tuple(video_size):
+            # Scaled by the encoding ffmpeg process, so the composite is encoded once, straight at the output size
+            ffmpeg_params += ['-vf', f"scale={size[0]}:{size[1]}:flags=lanczos"]
+        return fps, ffmpeg_params
+
+    def build_video(self, schema:Dict[str, Any], force_duration=None, with_audio=True) -> CompositeVideoClip:
+        visual_layers, _ = SchemaCompiler().compile_layers(schema, probe=False)
+        visual_clips = []
+        for layer in visual_layers:
+            try:
+                clip = self.build_clip(layer)
+            except Exception as e:
+                if layer.type != 'image':
+                    raise
+                print(f"Failed to load image {layer.parameters['url']}. Error : {str(e)}")
+                continue
             visual_clips.append(clip)
         
-        audio_clips = []
-
-        for asset_key in audio_assets:
-            asset = audio_assets[asset_key]
-            asset_type = asset['type']
-            if asset_type == "audio":
-                audio_clip = self.process_audio_asset(asset)
-            else:
-                raise ValueError(f"Invalid asset type: {asset_type}")
-
-            audio_clips.append(audio_clip)
-        video = CompositeVideoClip(visual_clips)
-        if(audio_clips):
-            audio = CompositeAudioClip(audio_clips)
+        video = IndexedCompositeVideoClip(visual_clips)
+        if with_audio and schema['audio_assets']:
+            audio = AudioMixer().build_clip(schema)
             video = video.with_audio(audio)
             video = video.with_duration(audio.duration)
         if force_duration:
             video = video.with_duration(force_duration)
-        if logger:
-            my_logger = MoviepyProgressLogger(callBackFunction=logger)
-            video.write_videofile(output_file, threads=threads,codec='libx264', audio_codec='aac', fps=25, preset='veryfast', logger=my_logger)
-        else:
-            video.write_videofile(output_file, threads=threads,codec='libx264', audio_codec='aac', fps=25, preset='veryfast')
-        return output_file
+        return video
     
     def generate_audio(self, schema:Dict[str, Any], output_file, logger=None) -> None:
-        audio_assets = dict(sorted(schema['audio_assets'].items(), key=lambda item: item[1]['z']))
-        audio_clips = []
-
-        for asset_key in audio_assets:
-            asset = audio_assets[asset_key]
-            asset_type = asset['type']
-            if asset_type == "audio":
-                audio_clip = self.process_audio_asset(asset)
+        audio = AudioMixer().build_clip(schema)
+        try:
+            if logger:
+                my_logger = get_progress_logger(logger)
+                audio.write_audiofile(output_file, logger=my_logger)
             else:
-                raise ValueError(f"Invalid asset type: {asset_type}")
-
-            audio_clips.append(audio_clip)
-        audio = CompositeAudioClip(audio_clips)
-        audio.fps = 44100
-        if logger:
-            my_logger = MoviepyProgressLogger(callBackFunction=logger)
-            audio.write_audiofile(output_file, logger=my_logger)
-        else:
-            audio.write_audiofile(output_file)
+                audio.write_audiofile(output_file)
+        finally:
+            audio.close()
         return output_file
+
+    def build_clip(self, layer: CompiledLayer) -> Clip:
+        if layer.type not in self._layer_builders:
+            raise ValueError(f'Invalid asset type: {layer.type}')
+        return self._layer_builders[layer.type](layer)
+
     # Process common actions
     def process_common_actions(self,
                                    clip: Union[VideoFileClip, ImageClip, TextClip, AudioFileClip],
                                    actions: List[Dict[str, Any]]) -> Union[VideoFileClip, AudioFileClip, ImageClip, TextClip]:
-        for action in actions:
-            if action['type'] == 'set_time_start':
-                clip = clip.with_start(action['param'])
-                continue
-   
-            if action['type'] == 'set_time_end':
-                clip = clip.with_end(action['param'])
-                continue
-            
-            if action['type'] == 'subclip':
-                clip = clip.subclipped(**action['param'])
-                continue
-
-        return clip
+        return apply_actions(clip, actions, COMMON_ACTIONS)
 
     # Process common visual clip actions
     def process_common_visual_actions(self,
                                    clip: Clip,
                                    actions: List[Dict[str, Any]]) -> Union[VideoFileClip, ImageClip, TextClip]:
         clip = self.process_common_actions(clip, actions)
-        for action in actions:
- 
-            if action['type'] == 'resize':
-                clip = clip.with_effects([vfx.Resize(**action['param'])])
-                continue
-
-            if action['type'] == 'crop':
-                clip = clip.with_effects([vfx.Crop(**action['param'])])
-                continue
-
-            if action['type'] == 'screen_position':
-                clip = clip.with_position(**action['param'])
-                continue
-
-            if action['type'] == 'green_screen':
-                params = action['param']
-                color = params['color'] if  params['color'] else [52, 255, 20]
-                thr = params["threshold"] if params["threshold"] else 100
-                s = params['stiffness'] if params['stiffness'] else 5
-                clip = clip.with_effects([vfx.MaskColor(color=color,threshold=thr, stiffness=s)])
-                continue
-
-            if action['type'] == 'normalize_image':
-                clip = clip.image_transform(self.__normalize_frame)
-                continue
-
-            if action['type'] == 'auto_resize_image':
-                ar = clip.aspect_ratio
-                height = action['param']['maxHeight']
-                width = action['param']['maxWidth']
-                if ar <1:
-                    clip = clip.with_effects([vfx.Resize((height*ar, height))])
-                else:
-                    clip = clip.with_effects([vfx.Resize((width, width/ar))])
-                continue
-
-        return clip
+        return apply_actions(clip, fuse_geometric_actions(actions, clip.size), VISUAL_ACTIONS)
 
     # Process audio actions
     def process_audio_actions(self, clip: AudioClip,
                             actions: List[Dict[str, Any]]) -> AudioClip:
         clip = self.process_common_actions(clip, actions)
-        for action in actions:
-            if action['type'] == 'normalize_music':
-                clip = clip.with_effects([afx.AudioNormalize()])
-                continue
-
-            if action['type'] == 'loop_background_music':
-                target_duration = action['param']
-                start = clip.duration * 0.15
-                clip = clip.subclipped(start)
-                clip = clip.with_effects([afx.AudioLoop(duration=target_duration)])
-                continue
-
-            if action['type'] == 'volume_percentage':
-                clip = clip.with_effects([afx.MultiplyVolume(action['param'])])
-                continue
-
-        return clip
-    # Process individual asset types
-    def process_video_asset(self, asset: Dict[str, Any]) -> VideoFileClip:
+        return apply_actions(clip, actions, AUDIO_ACTIONS)
+
+    # Process individual layer types
+    def process_video_layer(self, layer: CompiledLayer) -> VideoFileClip:
+        baked_actions, actions = split_prekeyable_actions(layer.actions)
+        if baked_actions:
+            clip = KEYED_OVERLAY_CACHE.load_clip(self.get_keyed_overlay(layer.parameters, baked_actions))
+            return self.process_common_visual_actions(clip, actions)
         params = {
-            'filename': handle_path(asset['parameters']['url'])
+            'filename': handle_path(layer.parameters['url'])
         }
-        if 'audio' in asset['parameters']:
-            params['audio'] = asset['parameters']['audio']
-        clip = VideoFileClip(**params)
-        return self.process_common_visual_actions(clip, asset['actions'])
-
-    def process_image_asset(self, asset: Dict[str, Any]) -> ImageClip:
-        clip = ImageClip(asset['parameters']['url'])
-        return self.process_common_visual_actions(clip, asset['actions'])
-
-    def process_text_asset(self, asset: Dict[str, Any]) -> TextClip:
-        text_clip_params = asset['parameters']
-        
+        if 'audio' in layer.parameters:
+            params['audio'] = layer.parameters['audio']
+        clip = MEDIA_READER_POOL.open_video_clip(**params)
+        return self.process_common_visual_actions(clip, layer.actions)
+
+    def get_keyed_overlay(self, parameters: Dict[str, Any], baked_actions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        def build_clip():
+            clip = VideoFileClip(handle_path(parameters['url']), audio=False)
+            return self.process_common_visual_actions(clip, baked_actions)
+        return KEYED_OVERLAY_CACHE.get_overlay(parameters['url'], baked_actions, build_clip, source_name=parameters.get('source_name'))
+
+    def process_image_layer(self, layer: CompiledLayer) -> ImageClip:
+        clip = ImageClip(layer.parameters['url'])
+        return self.process_common_visual_actions(clip, layer.actions)
+
+    def process_text_layer(self, layer: CompiledLayer) -> ImageClip:
+        clip_info = self.get_text_clip_info(layer.parameters)
+        clip = ImageClip(TEXT_SPRITE_CACHE.get_sprite(clip_info))
+        return self.process_common_visual_actions(clip, layer.actions)
+
+    def get_text_clip_info(self, text_clip_params: Dict[str, Any]) -> Dict[str, Any]:
         if not (any(key in text_clip_params for key in ['text','fontsize', 'size'])):
             raise Exception('You must include at least a size or a fontsize to determine the size of your text')
         text_method = text_clip_params.get('method', 'label')
@@ -220,41 +336,8 @@ class CoreEditingEngine:
             'method': text_method,
             'text_align': text_clip_params.get('text_align', 'center')
         }
-        clip_info = {k: v for k, v in clip_info.items() if v is not None}
-        clip = TextClip(**clip_info)
-        return self.process_common_visual_actions(clip, asset['actions'])
-
-    def process_audio_asset(self, asset: Dict[str, Any]) -> AudioFileClip:
-        clip = AudioFileClip(asset['parameters']['url'])
-        return self.process_audio_actions(clip, asset['actions'])
-    
-    def __normalize_image(self, clip):
-        def f(get_frame, t):
-            if f.normalized_frame is not None:
-                return f.normalized_frame
-            else:
-                frame = get_frame(t)
-                f.normalized_frame = self.__normalize_frame(frame)
-                return f.normalized_frame
-
-        f.normalized_frame = None
-
-        return clip.fl(f)
-
-
-    def __normalize_frame(self, frame):
-        shape = np.shape(frame)
-        [dimensions, ] = np.shape(shape)
-
-        if dimensions == 2:
-            (height, width) = shape
-            normalized_frame = np.zeros((height, width, 3))
-            for y in range(height):
-                for x in range(width):
-                    grey_value = frame[y][x]
-                    normalized_frame[y][x] = (grey_value, grey_value, grey_value)
-            return normalized_frame
-        else:
-            return frame
-        
+        return {k: v for k, v in clip_info.items() if v is not None}
 
+    def process_audio_layer(self, layer: CompiledLayer) -> AudioFileClip:
+        clip = AudioFileClip(layer.parameters['url'])
+        return self.process_audio_actions(clip, layer.actions)
@@ -0,0 +1,150 @@
+import copy
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+from typing import Any, Dict
+
+from shortGPT.config.path_utils import handle_path
+from shortGPT.editing_framework.keyed_overlay_cache import get_source_id
+
+DRAFT_SCALE = 1 / 3
+DRAFT_FPS = 12
+DRAFT_ENCODER_PROFILE = 'draft'
+PROXY_DIR = '.editing_assets/proxies/'
+PROXY_CACHE_MAX_SIZE = 2 * 1024 ** 3
+# Action parameters given in pixels, scaled with the draft
+PIXEL_ACTION_PARAMS = {
+    'crop': ['x1', 'y1', 'x2', 'y2', 'width', 'height', 'x_center', 'y_center'],
+    'resize': ['width', 'height'],
+    'auto_resize_image': ['maxWidth', 'maxHeight'],
+}
+PIXEL_TEXT_PARAMS = ['font_size', 'stroke_width']
+
+
+class ProxyCache:
+    """
+    Cache of low resolution, low frame rate proxies of the video sources, used by draft renders.
+    A proxy is keyed by its source, identified like a keyed overlay, and by its scale and fps.
+    The cache is bounded to max_size bytes, least recently used proxies are evicted first.
+    """
+
+    def __init__(self, proxy_dir=PROXY_DIR, max_size=PROXY_CACHE_MAX_SIZE):
+        self.proxy_dir = proxy_dir
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def get_key(self, url, scale, fps, source_name=None) -> str:
+        key_params = {'source': get_source_id(url, source_name), 'scale': scale, 'fps': fps}
+        return hashlib.sha256(json.dumps(key_params, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get_proxy(self, url, scale=DRAFT_SCALE, fps=DRAFT_FPS, source_name=None) -> str:
+        """
+        Returns the path of the proxy of the video at url, encoding it on a cache miss.
+        source_name is the asset name of the video when known.
+        """
+        proxy_path = os.path.join(self.proxy_dir, f"{self.get_key(url, scale, fps, source_name)}.mp4")
+        try:
+            # Refreshing the modification time keeps the proxy at the end of the LRU order
+            os.utime(proxy_path)
+        except FileNotFoundError:
+            with self._lock:
+                if not os.path.exists(proxy_path):
+                    self._build_proxy(handle_path(url), proxy_path, scale, fps)
+                    self.evict(keep_path=proxy_path)
+        return proxy_path
+
+    def evict(self, keep_path=None):
+        cached_files = []
+        if not os.path.isdir(self.proxy_dir):
+            return
+        for name in os.listdir(self.proxy_dir):
+            # Proxies being encoded are tmp_ files
+            if name.endswith('.mp4') and not name.startswith('tmp_'):
+                path = os.path.join(self.proxy_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                cached_files.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in cached_files)
+        for _, size, path in sorted(cached_files):
+            if total_size <= self.max_size:
+                break
+            if keep_path is not None and os.path.abspath(path) == os.path.abspath(keep_path):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def _build_proxy(self, url, proxy_path, scale, fps):
+        os.makedirs(self.proxy_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='tmp_', suffix='.mp4', dir=self.proxy_dir)
+        os.close(fd)
+        command = ['ffmpeg', '-y', '-loglevel', 'error', '-i', url,
+                   '-vf', f"scale=trunc(iw*{scale}/2)*2:trunc(ih*{scale}/2)*2:flags=bilinear,fps={fps}",
+                   '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '28', '-pix_fmt', 'yuv420p',
+                   '-c:a', 'aac', '-b:a', '96k', tmp_path]
+        try:
+            output = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            if output.returncode != 0:
+                raise Exception(f"Error creating the proxy of {url} using ffmpeg. {output.stderr.strip()}")
+            os.replace(tmp_path, proxy_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+PROXY_CACHE = ProxyCache()
+
+
+def scale_value(value, scale, min_value=0):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    return max(round(value * scale), min_value if value > 0 else 0)
+
+
+def make_draft_schema(schema: Dict[str, Any], scale=DRAFT_SCALE, fps=DRAFT_FPS) -> Dict[str, Any]:
+    """
+    Returns a copy of the editing schema laid out at scale: video sources are replaced by their
+    proxies, images are scaled down, and every parameter given in pixels is scaled, so the draft
+    looks like the final render at a lower resolution and frame rate.
+    """
+    schema = copy.deepcopy(schema)
+    for asset in schema['visual_assets'].values():
+        parameters, actions = asset['parameters'], asset['actions']
+        if asset['type'] == 'video':
+            try:
+                # Keyed overlays of the proxy are keyed by its url, apart from the full resolution ones
+                parameters['url'] = PROXY_CACHE.get_proxy(parameters['url'], scale, fps, source_name=parameters.get('source_name'))
+            except Exception as e:
+                print(f"Failed to create the proxy of {parameters['url']}, the draft uses the source. Error : {str(e)}")
+                actions.insert(0, {'type': 'resize', 'param': {'new_size': scale}})
+        elif asset['type'] == 'image':
+            actions.insert(0, {'type': 'resize', 'param': {'new_size': scale}})
+        elif asset['type'] == 'text':
+            for key in PIXEL_TEXT_PARAMS:
+                if parameters.get(key) is not None:
+                    parameters[key] = scale_value(parameters[key], scale, min_value=1)
+            if parameters.get('size'):
+                parameters['size'] = [scale_value(value, scale, min_value=1) for value in parameters['size']]
+        for action in actions:
+            param = action['param']
+            if action['type'] in PIXEL_ACTION_PARAMS:
+                for key in PIXEL_ACTION_PARAMS[action['type']]:
+                    if param.get(key) is not None:
+                        param[key] = scale_value(param[key], scale)
+                if action['type'] == 'resize' and isinstance(param.get('new_size'), (list, tuple)):
+                    param['new_size'] = [scale_value(value, scale) for value in param['new_size']]
+            elif action['type'] == 'screen_position' and not param.get('relative', False) and isinstance(param['pos'], (list, tuple)):
+                param['pos'] = [scale_value(value, scale) for value in param['pos']]
+    output = schema.get('output', {})
+    if output.get('size'):
+        output['size'] = [max(scale_value(value, scale) // 2 * 2, 2) for value in output['size']]
+    output['fps'] = fps
+    schema['output'] = output
+    return schema
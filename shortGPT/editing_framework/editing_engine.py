@@ -2,8 +2,17 @@ import json
 from typing import Any, Dict, List, Union
 from enum import Enum
 import collections.abc
+import os
+import threading
 
 from shortGPT.editing_framework.core_editing_engine import CoreEditingEngine
+from shortGPT.editing_framework.draft_mode import DRAFT_ENCODER_PROFILE, DRAFT_FPS, DRAFT_SCALE, make_draft_schema
+from shortGPT.editing_framework.encoder_profile import EncoderProfile, get_encoder_profile
+from shortGPT.editing_framework.ffmpeg_editing_engine import FFmpegEditingEngine
+from shortGPT.editing_framework.incremental_render import BASE_LAYER_ENCODER_PROFILE, make_composite_schema, split_base_layers
+from shortGPT.editing_framework.render_cache import RENDER_CACHE
+from shortGPT.editing_framework.schema_compiler import SchemaCompiler
+from shortGPT.editing_framework.sharded_editing_engine import ShardedEditingEngine
 
 def update_dict(d, u):
     for k, v in u.items():
@@ -43,67 +52,242 @@ class EditingStep(Enum):
 class Flow(Enum):
     WHITE_REDDIT_IMAGE_FLOW = "build_reddit_image.json"
 
+class RenderBackend(Enum):
+    MOVIEPY = "moviepy"
+    FFMPEG = "ffmpeg"
+
 from pathlib import Path
 
 _here = Path(__file__).parent
 STEPS_PATH = (_here / 'editing_steps/').resolve()
 FLOWS_PATH = (_here / 'flows/').resolve()
 
+ASSET_TYPES = ['video', 'image', 'text', 'audio']
+
+
+def copy_json(value):
+    # Structural copy of a parsed json document, much cheaper than copy.deepcopy since there is no memo to keep
+    if isinstance(value, dict):
+        return {k: copy_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_json(v) for v in value]
+    return value
+
+
+class EditingStepTemplate:
+    """
+    Parsed and validated editing step, with its inputs bound to the parameter and action slots they fill.
+    """
+
+    def __init__(self, editingStep: EditingStep):
+        json_step = json.loads(open(STEPS_PATH / f"{editingStep.value}", 'r', encoding='utf-8').read())
+        if len(json_step) != 1:
+            raise Exception(f"Error. Editing step '{editingStep.value}' must contain exactly one asset")
+        self.step_name, self.template = list(json_step.items())[0]
+        if self.template.get('type') not in ASSET_TYPES:
+            raise Exception(f"Error. Editing step '{editingStep.value}' has an invalid asset type '{self.template.get('type')}'")
+        self.assets_key = 'audio_assets' if self.template['type'] == 'audio' else 'visual_assets'
+
+        inputs = self.template.get('inputs')
+        self.required_args = []
+        self.parameter_slots = set()
+        self.action_slots = {}
+        if inputs is None:
+            return
+        self.required_args = inputs.get('actions', []) + inputs.get('parameters', [])
+        param_names = list(self.template.get('parameters', {}))
+        action_names = [action['type'] for action in self.template.get('actions', [])]
+        for arg_name in self.required_args:
+            if arg_name not in param_names and arg_name not in action_names:
+                raise Exception(f"Error. Input '{arg_name}' of editing step '{editingStep.value}' matches no parameter or action")
+        # An input can be bound to both a parameter and actions, it then fills all of them
+        if 'parameters' in inputs:
+            self.parameter_slots = set(param_names)
+        if 'actions' in inputs:
+            for i, action_name in enumerate(action_names):
+                self.action_slots.setdefault(action_name, []).append(i)
+
+    def instantiate(self, args: Dict[str, any]):
+        for required_argument in self.required_args:
+            if required_argument not in args:
+                raise Exception(
+                    f"Error. '{required_argument}' input missing, you must include it to use this editing step")
+        editingStepDict = copy_json(self.template)
+        if 'inputs' not in editingStepDict:
+            return editingStepDict
+        for arg_name, arg_value in args.items():
+            if arg_name in self.parameter_slots:
+                editingStepDict['parameters'][arg_name] = arg_value
+            for i in self.action_slots.get(arg_name, ()):
+                editingStepDict['actions'][i]['param'] = arg_value
+        return editingStepDict
+
+    def get_action_param(self, action_type):
+        for action in self.template.get('actions', []):
+            if action['type'] == action_type:
+                return copy_json(action['param'])
+        return None
+
+
+class FlowTemplate:
+    """
+    Parsed flow, with each input bound to the path of the schema value it fills.
+    """
+
+    def __init__(self, flow: Flow):
+        self.template = json.loads(open(FLOWS_PATH / f"{flow.value}", 'r', encoding='utf-8').read())
+        if 'inputs' not in self.template:
+            raise Exception(f"Error. Flow '{flow.value}' has no inputs")
+        self.input_paths = {input_name: path.split("/") for input_name, path in self.template['inputs'].items()}
+
+    def instantiate(self, args):
+        json_flow = copy_json(self.template)
+        for required_argument, path in self.input_paths.items():
+            if required_argument not in args:
+                raise Exception(
+                    f"Error. '{required_argument}' input missing, you must include it to use this editing step")
+            node = json_flow
+            for path_key in path[:-1]:
+                if not isinstance(node.get(path_key), dict):
+                    node[path_key] = {}
+                node = node[path_key]
+            node[path[-1]] = args[required_argument]
+        return json_flow
+
+
+class EditingTemplateRegistry:
+    """
+    Loads and validates every editing step and flow once per process.
+    """
+
+    def __init__(self):
+        self._steps = None
+        self._flows = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._steps is None:
+                self._flows = {flow: FlowTemplate(flow) for flow in Flow}
+                self._steps = {step: EditingStepTemplate(step) for step in EditingStep}
+
+    def get_step(self, editingStep: EditingStep) -> EditingStepTemplate:
+        if self._steps is None:
+            self.load()
+        return self._steps[editingStep]
+
+    def get_flow(self, flow: Flow) -> FlowTemplate:
+        if self._flows is None:
+            self.load()
+        return self._flows[flow]
+
+
+EDITING_TEMPLATE_REGISTRY = EditingTemplateRegistry()
+
+
+def remove_output(outputPath):
+    # Renderers overwrite their output in place, a previous output hardlinked to a cached file must not be written through
+    if os.path.exists(outputPath):
+        os.remove(outputPath)
+
+
 class EditingEngine:
     def __init__(self,):
         self.editing_step_tracker = dict((step, 0) for step in EditingStep)
         self.schema = {'visual_assets': {}, 'audio_assets': {}}
+        self.compile_report = None
 
     def addEditingStep(self, editingStep: EditingStep, args: Dict[str, any] = {}):
-        json_step = json.loads(
-            open(STEPS_PATH / f"{editingStep.value}", 'r', encoding='utf-8').read())
-        step_name, editingStepDict = list(json_step.items())[0]
-        if 'inputs' in editingStepDict:
-            required_args = (editingStepDict['inputs']['actions'] if 'actions' in editingStepDict['inputs'] else []) + (editingStepDict['inputs']['parameters'] if 'parameters' in editingStepDict['inputs'] else [])
-            for required_argument in required_args:
-                if required_argument not in args:
-                    raise Exception(
-                        f"Error. '{required_argument}' input missing, you must include it to use this editing step")
-            if required_args:
-                pass
-            action_names = [action['type'] for action in editingStepDict['actions']
-                            ] if 'actions' in editingStepDict else []
-            param_names = [param_name for param_name in editingStepDict['parameters']
-                           ] if 'parameters' in editingStepDict else []
-            for arg_name in args:
-                if ('inputs' in editingStepDict):
-                    if 'parameters' in editingStepDict['inputs'] and arg_name in param_names:
-                        editingStepDict['parameters'][arg_name] = args[arg_name]
-                        pass
-                    if 'actions' in editingStepDict['inputs'] and arg_name in action_names:
-                        for i, action in enumerate(editingStepDict['actions']):
-                            if action['type'] == arg_name:
-                                editingStepDict['actions'][i]['param'] = args[arg_name]
-        if editingStepDict['type'] == 'audio':
-            self.schema['audio_assets'][f"{step_name}_{self.editing_step_tracker[editingStep]}"] = editingStepDict
-        else:
-            self.schema['visual_assets'][f"{step_name}_{self.editing_step_tracker[editingStep]}"] = editingStepDict
+        template = EDITING_TEMPLATE_REGISTRY.get_step(editingStep)
+        editingStepDict = template.instantiate(args)
+        self.schema[template.assets_key][f"{template.step_name}_{self.editing_step_tracker[editingStep]}"] = editingStepDict
         self.editing_step_tracker[editingStep] += 1
 
 
     def ingestFlow(self, flow: Flow, args):
-        json_flow = json.loads(open(FLOWS_PATH / f"{flow.value}", 'r', encoding='utf-8').read())
-        for required_argument in list(json_flow['inputs'].keys()):
-                if required_argument not in args:
-                    raise Exception(
-                        f"Error. '{required_argument}' input missing, you must include it to use this editing step")
-                update = args[required_argument]
-                for path_key in reversed(json_flow['inputs'][required_argument].split("/")):
-                    update = {path_key: update}
-                json_flow = update_dict(json_flow, update)
-        self.schema = json_flow
+        self.schema = EDITING_TEMPLATE_REGISTRY.get_flow(flow).instantiate(args)
+
+    def setOutputFormat(self, size=None, fps=None):
+        # Applied by the renderers while encoding, so the video is encoded only once at this size and frame rate
+        self.schema['output'] = {}
+        if fps:
+            self.schema['output']['fps'] = fps
+        if size:
+            self.schema['output']['size'] = list(size)
 
     def dumpEditingSchema(self):
         return self.schema
     
-    def renderVideo(self, outputPath, logger=None):
-        engine = CoreEditingEngine()
-        engine.generate_video(self.schema, outputPath, logger=logger)
+    def compileSchema(self):
+        schema, self.compile_report = SchemaCompiler().compile(self.schema)
+        return schema
+
+    def renderVideo(self, outputPath, logger=None, backend: RenderBackend = RenderBackend.MOVIEPY, shards=1, use_cache=True,
+                    encoder_profile: Union[EncoderProfile, str, None] = None, optimize=True, draft=False, incremental=False):
+        if backend == RenderBackend.FFMPEG and shards > 1:
+            raise ValueError(f"shards={shards} can't be used with the ffmpeg backend, sharded rendering is only implemented by the moviepy backend")
+        if draft:
+            # Low resolution preview: scaled layout, proxies of the video sources, fastest encoder settings
+            encoder_profile = DRAFT_ENCODER_PROFILE
+        encoder_profile = get_encoder_profile(encoder_profile)
+        if use_cache:
+            encoder_settings = encoder_profile.to_dict()
+            # The thread count doesn't change the rendered video
+            del encoder_settings['threads']
+            encoder_settings['backend'] = backend.value
+            # The schema is hashed before compiling, an optimized render may differ from the unoptimized one
+            encoder_settings['optimize'] = optimize
+            if draft:
+                encoder_settings['draft'] = {'scale': DRAFT_SCALE, 'fps': DRAFT_FPS}
+            cache_key = RENDER_CACHE.get_key(self.schema, encoder_settings)
+            if RENDER_CACHE.get(cache_key, outputPath):
+                print(f"Render cache hit, {outputPath} was copied from the render cache")
+                return
+        schema = self.schema
+        if optimize:
+            schema = self.compileSchema()
+            if len(self.compile_report):
+                print(f"Schema compiler: {self.compile_report}")
+        if draft:
+            schema = make_draft_schema(schema, DRAFT_SCALE, DRAFT_FPS)
+        if backend == RenderBackend.FFMPEG:
+            engine = FFmpegEditingEngine()
+        elif shards > 1:
+            engine = ShardedEditingEngine(shards=shards)
+        else:
+            engine = CoreEditingEngine()
+        base_layer_path = None
+        if incremental:
+            layers = split_base_layers(schema)
+            if layers:
+                base_layer_path = "_base".join(os.path.splitext(outputPath))
+                self.renderBaseLayers(engine, schema, layers[0], base_layer_path, logger, backend, use_cache, encoder_profile)
+                schema = make_composite_schema(schema, layers[0], layers[1], base_layer_path)
+        remove_output(outputPath)
+        try:
+            engine.generate_video(schema, outputPath, logger=logger, encoder_profile=encoder_profile)
+        finally:
+            if base_layer_path and os.path.exists(base_layer_path):
+                os.remove(base_layer_path)
+        if use_cache:
+            RENDER_CACHE.put(cache_key, outputPath)
+
+    def renderBaseLayers(self, engine, schema, base_schema, outputPath, logger, backend: RenderBackend, use_cache, encoder_profile: EncoderProfile):
+        # The background videos are rendered once, later renders only changing the overlays composite them onto this video
+        base_schema['output']['fps'] = schema.get('output', {}).get('fps') or encoder_profile.fps
+        duration = SchemaCompiler().get_schema_duration(schema)
+        if use_cache:
+            base_settings = BASE_LAYER_ENCODER_PROFILE.to_dict()
+            del base_settings['threads']
+            base_settings.update({'backend': backend.value, 'duration': duration})
+            base_key = RENDER_CACHE.get_key(base_schema, base_settings)
+            if RENDER_CACHE.get(base_key, outputPath):
+                print(f"Base layers cache hit, {outputPath} was copied from the render cache")
+                return
+        remove_output(outputPath)
+        engine.generate_video(base_schema, outputPath, logger=logger, force_duration=duration, encoder_profile=BASE_LAYER_ENCODER_PROFILE)
+        if use_cache:
+            RENDER_CACHE.put(base_key, outputPath)
     def renderImage(self, outputPath, logger=None):
         engine = CoreEditingEngine()
         engine.generate_image(self.schema, outputPath, logger=logger)
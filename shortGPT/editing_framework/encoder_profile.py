@@ -0,0 +1,83 @@
+import os
+from typing import Any, Dict, List, Union
+
+
+class EncoderProfile:
+    """
+    Encoder settings of a rendered video, shared by every renderer.
+    crf and bitrate are exclusive ways of choosing the video quality, when both are
+    None the codec's default quality is used. threads defaults to the number of cores.
+    """
+
+    def __init__(self, name, codec='libx264', preset='veryfast', crf=None, bitrate=None, fps=25, pixel_format='yuv420p',
+                 threads=None, audio_codec='aac', audio_bitrate=None, movflags=None):
+        if crf is not None and bitrate is not None:
+            raise ValueError(f"Encoder profile '{name}' can't set both a crf and a bitrate")
+        self.name = name
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.bitrate = bitrate
+        self.fps = fps
+        self.pixel_format = pixel_format
+        self.threads = threads or os.cpu_count() or 1
+        self.audio_codec = audio_codec
+        self.audio_bitrate = audio_bitrate
+        self.movflags = movflags
+
+    def get_video_params(self) -> List[str]:
+        # Encoder options that moviepy's write_videofile has no argument for
+        params = []
+        if self.crf is not None:
+            params += ['-crf', str(self.crf)]
+        if self.pixel_format:
+            params += ['-pix_fmt', self.pixel_format]
+        if self.movflags:
+            params += ['-movflags', self.movflags]
+        return params
+
+    def get_ffmpeg_video_args(self, threads=None) -> List[str]:
+        # threads overrides the thread count of the profile
+        args = ['-c:v', self.codec, '-preset', self.preset]
+        if self.bitrate:
+            args += ['-b:v', self.bitrate]
+        return args + self.get_video_params() + ['-threads', str(threads or self.threads)]
+
+    def get_ffmpeg_audio_args(self) -> List[str]:
+        args = ['-c:a', self.audio_codec]
+        if self.audio_bitrate:
+            args += ['-b:a', self.audio_bitrate]
+        return args
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'codec': self.codec,
+            'preset': self.preset,
+            'crf': self.crf,
+            'bitrate': self.bitrate,
+            'fps': self.fps,
+            'pixel_format': self.pixel_format,
+            'threads': self.threads,
+            'audio_codec': self.audio_codec,
+            'audio_bitrate': self.audio_bitrate,
+            'movflags': self.movflags
+        }
+
+
+ENCODER_PROFILES = {
+    'draft': EncoderProfile('draft', preset='ultrafast', crf=30, audio_bitrate='96k'),
+    'standard': EncoderProfile('standard', movflags='+faststart'),
+    'archive': EncoderProfile('archive', preset='slow', crf=18, audio_bitrate='192k', movflags='+faststart'),
+}
+DEFAULT_ENCODER_PROFILE = 'standard'
+
+
+def get_encoder_profile(encoder_profile: Union[EncoderProfile, str, None] = None) -> EncoderProfile:
+    if encoder_profile is None:
+        encoder_profile = DEFAULT_ENCODER_PROFILE
+    if isinstance(encoder_profile, EncoderProfile):
+        return encoder_profile
+    if encoder_profile not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile '{encoder_profile}', choose one of {list(ENCODER_PROFILES.keys())}")
+    return ENCODER_PROFILES[encoder_profile]
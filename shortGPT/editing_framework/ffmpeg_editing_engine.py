@@ -0,0 +1,356 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import Any, Dict, List
+
+from shortGPT.config.path_utils import handle_path
+from shortGPT.editing_framework.core_editing_engine import CoreEditingEngine
+from shortGPT.editing_framework.encoder_profile import EncoderProfile, get_encoder_profile
+from shortGPT.editing_framework.keyed_overlay_cache import split_prekeyable_actions
+from shortGPT.editing_framework.rendering_logger import get_progress_logger
+from shortGPT.editing_framework.text_sprite_cache import TEXT_SPRITE_CACHE
+from shortGPT.editing_framework.transform_fusion import compute_position
+
+# Actions CoreEditingEngine implements but that have no exact filtergraph equivalent.
+# A schema using any of them is rendered by the moviepy engine instead, except for green_screen
+# actions baked into a keyed overlay (see keyed_overlay_cache.py).
+UNSUPPORTED_ACTIONS = {'green_screen', 'normalize_music'}
+AUDIO_FPS = 44100
+
+
+class UnsupportedSchemaError(Exception):
+    pass
+
+
+def probe_media(url):
+    cmd = ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", "-i", url]
+    output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if output.returncode != 0:
+        raise Exception(f"Error probing {url} using ffprobe. {output.stderr.strip()}")
+    metadata = json.loads(output.stdout)
+    infos = {'width': None, 'height': None, 'duration': None}
+    video_streams = [s for s in metadata.get('streams', []) if s.get('codec_type') == 'video']
+    if video_streams:
+        infos['width'], infos['height'] = int(video_streams[0]['width']), int(video_streams[0]['height'])
+    if 'duration' in metadata.get('format', {}):
+        infos['duration'] = float(metadata['format']['duration'])
+    return infos
+
+
+class FFmpegEditingEngine:
+    """
+    Renders an editing schema with a single ffmpeg filter_complex invocation.
+    Layers are composited in the same order, at the same positions and over the
+    same time windows as CoreEditingEngine.generate_video, so both backends
+    produce comparable frames. Schemas using actions listed in UNSUPPORTED_ACTIONS
+    are handed over to CoreEditingEngine.
+    """
+
+    def __init__(self, fps=25):
+        self.fps = fps
+        self.output_size = None
+        self.pixel_format = 'yuv420p'
+
+    def generate_video(self, schema: Dict[str, Any], output_file, logger=None, force_duration=None, threads=None, encoder_profile=None):
+        encoder_profile = get_encoder_profile(encoder_profile)
+        try:
+            self.check_schema(schema)
+        except UnsupportedSchemaError as e:
+            print(f"FFmpeg backend can't render this schema ({e}). Falling back to moviepy.")
+            return CoreEditingEngine().generate_video(schema, output_file, logger=logger, force_duration=force_duration, threads=threads,
+                                                      encoder_profile=encoder_profile)
+
+        output = schema.get('output', {})
+        self.fps = output.get('fps') or encoder_profile.fps
+        self.pixel_format = encoder_profile.pixel_format or self.pixel_format
+        self.output_size = output.get('size')
+        visual_assets = dict(sorted(schema['visual_assets'].items(), key=lambda item: item[1]['z']))
+        audio_assets = dict(sorted(schema['audio_assets'].items(), key=lambda item: item[1]['z']))
+        work_dir = tempfile.mkdtemp(prefix='shortgpt_ffmpeg_')
+        try:
+            visual_layers = []
+            for asset_key in visual_assets:
+                asset = visual_assets[asset_key]
+                asset_type = asset['type']
+                if asset_type == 'video':
+                    layer = self.process_video_asset(asset)
+                elif asset_type == 'image':
+                    try:
+                        layer = self.process_image_asset(asset)
+                    except Exception as e:
+                        print(f"Failed to load image {asset['parameters']['url']}. Error : {str(e)}")
+                        continue
+                elif asset_type == 'text':
+                    layer = self.process_text_asset(asset)
+                else:
+                    raise ValueError(f'Invalid asset type: {asset_type}')
+                visual_layers.append(layer)
+
+            audio_layers = []
+            for asset_key in audio_assets:
+                asset = audio_assets[asset_key]
+                asset_type = asset['type']
+                if asset_type == "audio":
+                    audio_layers.append(self.process_audio_asset(asset))
+                else:
+                    raise ValueError(f"Invalid asset type: {asset_type}")
+
+            if not visual_layers:
+                raise Exception("Can't render a video without any visual asset")
+            duration = self.get_duration(visual_layers, audio_layers, force_duration)
+            command = self.build_command(visual_layers, audio_layers, duration, output_file, work_dir, threads, encoder_profile)
+            self.run_command(command, duration, logger)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return output_file
+
+    def check_schema(self, schema: Dict[str, Any]):
+        for asset_key, asset in list(schema['visual_assets'].items()) + list(schema['audio_assets'].items()):
+            actions = asset['actions']
+            if asset['type'] == 'video':
+                _, actions = split_prekeyable_actions(actions)
+            for action in actions:
+                if action['type'] in UNSUPPORTED_ACTIONS:
+                    raise UnsupportedSchemaError(f"'{action['type']}' action used in '{asset_key}'")
+            if asset['type'] == 'video' and asset['parameters'].get('audio', True):
+                raise UnsupportedSchemaError(f"'{asset_key}' video asset keeps its own audio track")
+
+    # Time handling, mirrors moviepy's with_start / with_end / subclipped semantics
+    def process_common_actions(self, layer: Dict[str, Any], actions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        for action in actions:
+            if action['type'] == 'set_time_start':
+                layer['start'] = action['param']
+                if layer['duration'] is not None:
+                    layer['end'] = layer['start'] + layer['duration']
+                elif layer['end'] is not None:
+                    layer['duration'] = layer['end'] - layer['start']
+                continue
+
+            if action['type'] == 'set_time_end':
+                layer['end'] = action['param']
+                layer['duration'] = layer['end'] - layer['start']
+                continue
+
+            if action['type'] == 'subclip':
+                start_time = action['param'].get('start_time', 0)
+                end_time = action['param'].get('end_time')
+                if end_time is None and layer['duration'] is not None:
+                    end_time = layer['duration']
+                layer['offset'] += start_time
+                if end_time is not None:
+                    layer['duration'] = end_time - start_time
+                    layer['end'] = layer['start'] + layer['duration']
+                continue
+
+        return layer
+
+    def process_common_visual_actions(self, layer: Dict[str, Any], actions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        layer = self.process_common_actions(layer, actions)
+        for action in actions:
+            if action['type'] == 'resize':
+                self.add_resize(layer, **action['param'])
+                continue
+
+            if action['type'] == 'crop':
+                self.add_crop(layer, **action['param'])
+                continue
+
+            if action['type'] == 'screen_position':
+                layer['pos'] = action['param']['pos']
+                layer['relative'] = action['param'].get('relative', False)
+                continue
+
+            if action['type'] == 'auto_resize_image':
+                width, height = layer['size']
+                ar = width / height
+                max_height = action['param']['maxHeight']
+                max_width = action['param']['maxWidth']
+                if ar < 1:
+                    self.add_resize(layer, new_size=(max_height * ar, max_height))
+                else:
+                    self.add_resize(layer, new_size=(max_width, max_width / ar))
+                continue
+
+        return layer
+
+    def add_resize(self, layer, new_size=None, height=None, width=None):
+        w, h = layer['size']
+        if new_size is not None:
+            if isinstance(new_size, (int, float)):
+                new_size = [new_size * w, new_size * h]
+        elif height is not None:
+            new_size = [w * height / h, height]
+        elif width is not None:
+            new_size = [width, h * width / w]
+        else:
+            raise ValueError("You must provide either 'new_size' or 'height' or 'width'")
+        new_size = [int(new_size[0]), int(new_size[1])]
+        layer['filters'].append(f"scale={new_size[0]}:{new_size[1]}:flags=lanczos")
+        layer['size'] = new_size
+
+    def add_crop(self, layer, x1=None, y1=None, x2=None, y2=None, width=None, height=None, x_center=None, y_center=None):
+        if width and x1 is not None:
+            x2 = x1 + width
+        elif width and x2 is not None:
+            x1 = x2 - width
+        if height and y1 is not None:
+            y2 = y1 + height
+        elif height and y2 is not None:
+            y1 = y2 - height
+        if x_center:
+            x1, x2 = x_center - width / 2, x_center + width / 2
+        if y_center:
+            y1, y2 = y_center - height / 2, y_center + height / 2
+        w, h = layer['size']
+        # Same clamping numpy applies when CoreEditingEngine slices the frame
+        x1, x2 = min(max(int(x1 or 0), 0), w), min(int(x2 or w), w)
+        y1, y2 = min(max(int(y1 or 0), 0), h), min(int(y2 or h), h)
+        layer['filters'].append(f"crop={x2 - x1}:{y2 - y1}:{x1}:{y1}")
+        layer['size'] = [x2 - x1, y2 - y1]
+
+    def process_audio_actions(self, layer: Dict[str, Any], actions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        layer = self.process_common_actions(layer, actions)
+        if layer['offset']:
+            layer['filters'].append(f"atrim=start={layer['offset']:.6f},asetpts=PTS-STARTPTS")
+        for action in actions:
+            if action['type'] == 'loop_background_music':
+                target_duration = action['param']
+                start = layer['duration'] * 0.15
+                loop_samples = int((layer['duration'] - start) * AUDIO_FPS) + 1
+                layer['filters'].append(f"aresample={AUDIO_FPS},atrim=start={start:.6f},asetpts=PTS-STARTPTS")
+                layer['filters'].append(f"aloop=loop=-1:size={loop_samples}")
+                layer['duration'] = target_duration
+                layer['end'] = layer['start'] + target_duration
+                continue
+
+            if action['type'] == 'volume_percentage':
+                layer['filters'].append(f"volume={action['param']}")
+                continue
+
+        return layer
+
+    # Process individual asset types
+    def process_video_asset(self, asset: Dict[str, Any]) -> Dict[str, Any]:
+        baked_actions, actions = split_prekeyable_actions(asset['actions'])
+        if baked_actions:
+            # Keyed once by CoreEditingEngine, the RGBA frames are overlaid as an image sequence
+            overlay = CoreEditingEngine().get_keyed_overlay(asset['parameters'], baked_actions)
+            url = os.path.join(overlay['frames_dir'], overlay['frame_pattern'])
+            layer = self.new_layer(url, overlay['size'], overlay['n_frames'] / overlay['fps'])
+            layer['input_args'] = ['-framerate', str(overlay['fps']), '-start_number', '0']
+        else:
+            url = handle_path(asset['parameters']['url'])
+            infos = probe_media(url)
+            layer = self.new_layer(url, [infos['width'], infos['height']], infos['duration'])
+        layer = self.process_common_visual_actions(layer, actions)
+        if layer['offset']:
+            layer['filters'].insert(0, f"trim=start={layer['offset']:.6f}")
+        layer['filters'].append(f"setpts=PTS-STARTPTS+{layer['start']}/TB")
+        return layer
+
+    def process_image_asset(self, asset: Dict[str, Any]) -> Dict[str, Any]:
+        url = asset['parameters']['url']
+        infos = probe_media(url)
+        layer = self.new_layer(url, [infos['width'], infos['height']], None, still=True)
+        return self.process_common_visual_actions(layer, asset['actions'])
+
+    def process_text_asset(self, asset: Dict[str, Any]) -> Dict[str, Any]:
+        clip_info = CoreEditingEngine().get_text_clip_info(asset['parameters'])
+        height, width = TEXT_SPRITE_CACHE.get_sprite(clip_info).shape[:2]
+        sprite_path = TEXT_SPRITE_CACHE.get_sprite_path(clip_info)
+        layer = self.new_layer(sprite_path, [width, height], None, still=True)
+        return self.process_common_visual_actions(layer, asset['actions'])
+
+    def process_audio_asset(self, asset: Dict[str, Any]) -> Dict[str, Any]:
+        url = asset['parameters']['url']
+        infos = probe_media(url)
+        layer = self.new_layer(url, None, infos['duration'])
+        return self.process_audio_actions(layer, asset['actions'])
+
+    def new_layer(self, url, size, duration, still=False):
+        return {
+            'url': url,
+            'still': still,
+            'size': size,
+            'duration': duration,
+            'start': 0,
+            'end': duration,
+            'offset': 0,
+            'pos': None,
+            'relative': False,
+            'filters': [],
+            'input_args': [],
+        }
+
+    def get_duration(self, visual_layers, audio_layers, force_duration):
+        if force_duration:
+            return force_duration
+        if audio_layers:
+            return max(layer['end'] for layer in audio_layers)
+        ends = [layer['end'] for layer in visual_layers]
+        if None in ends:
+            raise Exception("Can't determine the duration of the video, every visual asset needs an end time when no audio is provided")
+        return max(ends)
+
+    def build_filtergraph(self, visual_layers, audio_layers, duration):
+        canvas_size = visual_layers[0]['size']
+        graph = [f"color=c=black:s={canvas_size[0]}x{canvas_size[1]}:r={self.fps}:d={duration:.6f}[bg0]"]
+        for i, layer in enumerate(visual_layers):
+            filters = ",".join(layer['filters']) or "null"
+            graph.append(f"[{i}:v]{filters}[v{i}]")
+            x, y = compute_position(layer['pos'], layer['relative'], layer['size'], canvas_size)
+            enable = f"gte(t,{layer['start']})" if layer['end'] is None else f"gte(t,{layer['start']})*lt(t,{layer['end']})"
+            graph.append(f"[bg{i}][v{i}]overlay=x={x}:y={y}:enable='{enable}'[bg{i + 1}]")
+        output_filters = [f"fps={self.fps}"]
+        if self.output_size and tuple(self.output_size) != tuple(canvas_size):
+            output_filters.append(f"scale={self.output_size[0]}:{self.output_size[1]}:flags=lanczos")
+        output_filters.append(f"format={self.pixel_format}")
+        graph.append(f"[bg{len(visual_layers)}]{','.join(output_filters)}[vout]")
+
+        if audio_layers:
+            first_audio_input = len(visual_layers)
+            for i, layer in enumerate(audio_layers):
+                filters = list(layer['filters'])
+                filters.append(f"atrim=duration={layer['end'] - layer['start']:.6f}")
+                filters.append(f"aresample={AUDIO_FPS}")
+                if layer['start']:
+                    filters.append(f"adelay={int(layer['start'] * 1000)}:all=1")
+                graph.append(f"[{first_audio_input + i}:a]{','.join(filters)}[a{i}]")
+            audio_inputs = "".join(f"[a{i}]" for i in range(len(audio_layers)))
+            graph.append(f"{audio_inputs}amix=inputs={len(audio_layers)}:normalize=0:duration=longest[aout]")
+        return ";\n".join(graph)
+
+    def build_command(self, visual_layers, audio_layers, duration, output_file, work_dir, threads=None, encoder_profile: EncoderProfile = None):
+        encoder_profile = get_encoder_profile(encoder_profile)
+        graph_path = os.path.join(work_dir, 'filtergraph.txt')
+        with open(graph_path, 'w', encoding='utf-8') as f:
+            f.write(self.build_filtergraph(visual_layers, audio_layers, duration))
+
+        command = ['ffmpeg', '-y', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1']
+        for layer in visual_layers + audio_layers:
+            if layer['still']:
+                # Still images are looped into a stream, bounded so ffmpeg doesn't keep decoding them past the render
+                still_duration = min(layer['end'], duration) if layer['end'] is not None else duration
+                command += ['-loop', '1', '-framerate', str(self.fps), '-t', f"{still_duration:.6f}"]
+            command += layer['input_args'] + ['-i', layer['url']]
+        command += ['-filter_complex_script', graph_path, '-map', '[vout]']
+        if audio_layers:
+            command += ['-map', '[aout]'] + encoder_profile.get_ffmpeg_audio_args() + ['-ar', str(AUDIO_FPS)]
+        command += encoder_profile.get_ffmpeg_video_args(threads) + ['-r', str(self.fps), '-t', f"{duration:.6f}"]
+        command.append(output_file)
+        return command
+
+    def run_command(self, command, duration, logger=None):
+        my_logger = get_progress_logger(logger)
+        total_frames = int(duration * self.fps)
+        my_logger(frame_index__total=total_frames)
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            if key == 'frame' and value.isdigit():
+                my_logger(frame_index__index=min(int(value), total_frames))
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise Exception(f"Error rendering video using ffmpeg. {stderr.strip()}")
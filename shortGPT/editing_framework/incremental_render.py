@@ -0,0 +1,53 @@
+import copy
+from typing import Any, Dict, Optional, Tuple
+
+from shortGPT.editing_framework.encoder_profile import EncoderProfile
+
+# Intermediate encoding of the cached base layers, the overlays are composited onto its frames
+BASE_LAYER_ENCODER_PROFILE = EncoderProfile('base_layer', preset='ultrafast', crf=0, pixel_format='yuv444p', audio_bitrate='96k')
+BASE_LAYER_ASSET = 'base_layer'
+
+
+def is_base_asset(asset: Dict[str, Any]) -> bool:
+    # Opaque videos whose sound isn't mixed into the video, like the background videos of the editing steps
+    if asset['type'] != 'video' or asset['parameters'].get('audio', True):
+        return False
+    return not any(action['type'] == 'green_screen' for action in asset['actions'])
+
+
+def split_base_layers(schema: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Splits the visual assets of the schema into the base layers, the background videos at the
+    bottom of the stack, and the overlays drawn over them, e.g. captions, images, watermark and
+    green screened animations. Returns the schema of the base layers, without any audio, and
+    the overlay assets, or None when the schema has no base layer or no overlay.
+    """
+    visual_assets = sorted(schema['visual_assets'].items(), key=lambda item: item[1]['z'])
+    n_base = 0
+    while n_base < len(visual_assets) and is_base_asset(visual_assets[n_base][1]):
+        n_base += 1
+    if n_base == 0 or n_base == len(visual_assets):
+        return None
+    output = {key: value for key, value in schema.get('output', {}).items() if key != 'size'}
+    base_schema = {
+        'visual_assets': copy.deepcopy(dict(visual_assets[:n_base])),
+        'audio_assets': {},
+        # The overlays are positioned on the canvas, the output scaling is left to the final render
+        'output': output,
+    }
+    return base_schema, copy.deepcopy(dict(visual_assets[n_base:]))
+
+
+def make_composite_schema(schema: Dict[str, Any], base_schema: Dict[str, Any], overlays: Dict[str, Any], base_layer_path) -> Dict[str, Any]:
+    """Returns the schema drawing the overlays and mixing the audio of schema over the rendered base layers."""
+    base_layer = {
+        'type': 'video',
+        'z': min(asset['z'] for asset in base_schema['visual_assets'].values()),
+        'parameters': {'url': base_layer_path, 'audio': False},
+        'actions': [],
+    }
+    return {
+        'visual_assets': {BASE_LAYER_ASSET: base_layer, **overlays},
+        'audio_assets': copy.deepcopy(schema['audio_assets']),
+        'output': copy.deepcopy(schema.get('output', {})),
+    }
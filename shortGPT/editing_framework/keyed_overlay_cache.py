@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Callable, Dict, List
+from urllib.parse import urlsplit
+
+import numpy as np
+from moviepy import VideoClip
+from PIL import Image
+
+KEYED_OVERLAY_CACHE_DIR = '.editing_assets/keyed_overlays/'
+KEYED_OVERLAY_CACHE_MAX_SIZE = 2 * 1024 ** 3
+FRAME_PATTERN = 'frame_%05d.png'
+# Actions that only depend on the source pixels, applied once and baked into the cached frames
+PREKEYABLE_ACTIONS = {'resize', 'crop', 'green_screen'}
+# Actions that don't change the pixels of a frame, they can be left to the renderer in any order
+PIXEL_INDEPENDENT_ACTIONS = {'set_time_start', 'set_time_end', 'subclip', 'screen_position'}
+
+
+def get_canonical_url(url, source_name=None) -> str:
+    # Remote assets resolve to stream links that expire and are refreshed, such as YouTube's googlevideo links,
+    # so they are identified by the url they were added to the AssetDatabase with, and other urls by their query-less url
+    if source_name:
+        try:
+            # Imported here, the AssetDatabase opens its database when it is imported
+            from shortGPT.config.asset_db import AssetDatabase
+            asset = AssetDatabase.remote_assets._get(source_name)
+            if asset and asset.get('url'):
+                return asset['url']
+        except Exception as e:
+            print(f"Failed to get the url of the asset {source_name}. Error : {str(e)}")
+    return urlsplit(url)._replace(query='', fragment='').geturl()
+
+
+def get_source_id(url, source_name=None) -> Dict[str, Any]:
+    # Local files are identified by their path, size and modification time, so that a re-pointed or re-downloaded
+    # source is never served the cached frames of the previous one. Remote sources by their canonical url.
+    if os.path.isfile(url):
+        stat = os.stat(url)
+        return {'url': url, 'source_name': source_name, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    return {'url': get_canonical_url(url, source_name), 'source_name': source_name}
+
+
+def split_prekeyable_actions(actions: List[Dict[str, Any]]):
+    """
+    Splits the actions of a green screened video asset into the actions baked into its keyed overlay
+    and the ones still applied at render time. Returns no baked actions when the asset isn't keyed, or
+    when an action that can't be baked has to run before the keying.
+    """
+    keying_indices = [i for i, action in enumerate(actions) if action['type'] == 'green_screen']
+    if not keying_indices:
+        return [], actions
+    prefix = actions[:keying_indices[-1] + 1]
+    if any(action['type'] not in PREKEYABLE_ACTIONS | PIXEL_INDEPENDENT_ACTIONS for action in prefix):
+        return [], actions
+    baked_actions = [action for action in prefix if action['type'] in PREKEYABLE_ACTIONS]
+    remaining_actions = [action for action in actions if not any(action is baked for baked in baked_actions)]
+    return baked_actions, remaining_actions
+
+
+class KeyedOverlayCache:
+    """
+    Cache of chroma keyed video overlays, such as the subscribe animation.
+    The keyed frames are rendered once, resized and with their mask baked in the alpha
+    channel, into an RGBA png sequence keyed by the source and the baked actions. Renders
+    then composite the cached frames without keying them again. The cache is bounded to
+    max_size bytes, least recently used overlays are evicted first.
+    """
+
+    def __init__(self, cache_dir=KEYED_OVERLAY_CACHE_DIR, max_size=KEYED_OVERLAY_CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def get_key(self, url, baked_actions: List[Dict[str, Any]], source_name=None) -> str:
+        key_params = {'source': get_source_id(url, source_name), 'actions': baked_actions}
+        return hashlib.sha256(json.dumps(key_params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get_overlay(self, url, baked_actions: List[Dict[str, Any]], build_clip: Callable[[], VideoClip], source_name=None) -> Dict[str, Any]:
+        """
+        Returns the overlay infos (frames_dir, frame_pattern, fps, n_frames, size), keying the frames
+        of build_clip() on a cache miss. url is the source video, source_name its asset name when known.
+        """
+        overlay_dir = os.path.join(self.cache_dir, self.get_key(url, baked_actions, source_name))
+        infos_path = os.path.join(overlay_dir, 'overlay.json')
+        try:
+            # Refreshing the modification time keeps the overlay at the end of the LRU order
+            os.utime(infos_path)
+        except FileNotFoundError:
+            with self._lock:
+                if not os.path.exists(infos_path):
+                    self._build_overlay(overlay_dir, build_clip)
+                    self.evict(keep_dir=overlay_dir)
+        with open(infos_path, 'r', encoding='utf-8') as f:
+            overlay = json.load(f)
+        overlay['frames_dir'] = overlay_dir
+        return overlay
+
+    def evict(self, keep_dir=None):
+        cached_overlays = []
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            overlay_dir = os.path.join(self.cache_dir, name)
+            infos_path = os.path.join(overlay_dir, 'overlay.json')
+            # Overlays being keyed are in tmp_ directories without infos yet
+            if name.startswith('tmp_') or not os.path.exists(infos_path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(overlay_dir) if entry.is_file())
+                cached_overlays.append((os.stat(infos_path).st_mtime, size, overlay_dir))
+            except FileNotFoundError:
+                continue
+        total_size = sum(size for _, size, _ in cached_overlays)
+        for _, size, overlay_dir in sorted(cached_overlays):
+            if total_size <= self.max_size:
+                break
+            if keep_dir is not None and os.path.abspath(overlay_dir) == os.path.abspath(keep_dir):
+                continue
+            shutil.rmtree(overlay_dir, ignore_errors=True)
+            total_size -= size
+
+    def load_clip(self, overlay: Dict[str, Any]) -> VideoClip:
+        fps, n_frames = overlay['fps'], overlay['n_frames']
+        frame_pattern = os.path.join(overlay['frames_dir'], overlay['frame_pattern'])
+        last_frame = {'index': None, 'rgba': None}
+
+        def get_rgba(t):
+            # Same frame lookup as moviepy's FFMPEG_VideoReader, each png is decoded once for the frame and its mask
+            index = min(int(fps * t + 0.00001), n_frames - 1)
+            if last_frame['index'] != index:
+                last_frame['rgba'] = np.array(Image.open(frame_pattern % index).convert('RGBA'))
+                last_frame['index'] = index
+            return last_frame['rgba']
+
+        duration = n_frames / fps
+        mask = VideoClip(lambda t: get_rgba(t)[:, :, 3] / 255.0, is_mask=True, duration=duration)
+        clip = VideoClip(lambda t: get_rgba(t)[:, :, :3], duration=duration).with_mask(mask)
+        clip.fps = fps
+        return clip
+
+    def _build_overlay(self, overlay_dir, build_clip):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Keyed into a temporary directory first, so that concurrent renders never read a partial overlay
+        tmp_dir = tempfile.mkdtemp(prefix='tmp_', dir=self.cache_dir)
+        try:
+            clip = build_clip()
+            fps = clip.fps
+            n_frames = int(clip.duration * fps)
+            for index in range(n_frames):
+                t = index / fps
+                frame = clip.get_frame(t).astype('uint8')
+                if clip.mask is not None:
+                    alpha = (clip.mask.get_frame(t) * 255).round().astype('uint8')
+                else:
+                    alpha = np.full(frame.shape[:2], 255, dtype='uint8')
+                Image.fromarray(np.dstack([frame, alpha])).save(os.path.join(tmp_dir, FRAME_PATTERN % index), format='PNG')
+            clip.close()
+            infos = {'frame_pattern': FRAME_PATTERN, 'fps': fps, 'n_frames': n_frames, 'size': list(clip.size)}
+            with open(os.path.join(tmp_dir, 'overlay.json'), 'w', encoding='utf-8') as f:
+                json.dump(infos, f)
+            try:
+                os.replace(tmp_dir, overlay_dir)
+            except OSError:
+                # Another process keyed the same overlay first
+                if not os.path.exists(os.path.join(overlay_dir, 'overlay.json')):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+KEYED_OVERLAY_CACHE = KeyedOverlayCache()
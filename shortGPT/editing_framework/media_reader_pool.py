@@ -0,0 +1,210 @@
+import queue
+import threading
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+from moviepy import AudioFileClip, VideoClip, VideoFileClip
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
+
+MAX_OPEN_READERS = 8
+# Frames FFMPEG_VideoReader skips by reading forward instead of seeking
+READ_AHEAD_FRAMES = 100
+# Frames decoded ahead of the renderer by each open reader, 0 reads the frames synchronously
+PREFETCH_FRAMES = 4
+
+
+class FramePrefetcher:
+    """
+    Reads the raw frames of an ffmpeg reader process ahead, on a background thread, into a
+    ring buffer of preallocated frames. Reading from the pipe releases the GIL, so ffmpeg
+    keeps decoding while the renderer composites. A frame returned by next_frame stays
+    valid until the following call.
+    """
+
+    def __init__(self, stdout, frame_shape, n_frames=PREFETCH_FRAMES):
+        self.stdout = stdout
+        self.frames = [np.empty(frame_shape, dtype=np.uint8) for _ in range(n_frames)]
+        self.free_slots = queue.Queue()
+        for i in range(n_frames):
+            self.free_slots.put(i)
+        self.ready_slots = queue.Queue()
+        self.current_slot = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                try:
+                    slot = self.free_slots.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                buffer = memoryview(self.frames[slot]).cast('B')
+                filled = 0
+                while filled < len(buffer):
+                    n = self.stdout.readinto(buffer[filled:])
+                    if not n:
+                        break
+                    filled += n
+                if filled < len(buffer):
+                    break
+                self.ready_slots.put(slot)
+        except (OSError, ValueError):
+            # The pipe was closed by stop()
+            pass
+        # End of the stream
+        self.ready_slots.put(None)
+
+    def next_frame(self):
+        slot = self.ready_slots.get()
+        if self.current_slot is not None:
+            self.free_slots.put(self.current_slot)
+            self.current_slot = None
+        if slot is None:
+            self.ready_slots.put(None)
+            return None
+        self.current_slot = slot
+        return self.frames[slot]
+
+    def stop(self):
+        # Called before the reader process is terminated, which unblocks the pending pipe read
+        self._stopped.set()
+
+    def join(self):
+        self._thread.join()
+
+
+class PooledVideoReader(FFMPEG_VideoReader):
+    """
+    moviepy video reader whose ffmpeg process is only started when a frame is read.
+    Its process is registered in a MediaReaderPool, which may close it at any time,
+    the next frame read then reopens it at the requested time.
+    """
+
+    def __init__(self, filename, pool: 'MediaReaderPool', decode_file=False, prefetch_frames=PREFETCH_FRAMES):
+        self.pool = pool
+        self.prefetch_frames = prefetch_frames
+        self.prefetcher = None
+        self._deferred = True
+        super().__init__(filename, decode_file=decode_file)
+        self._deferred = False
+
+    def initialize(self, start_time=0):
+        # FFMPEG_VideoReader starts its process from __init__, it is deferred to the first read
+        if self._deferred:
+            return
+        super().initialize(start_time)
+        self.pool.acquire(self)
+
+    def get_frame(self, t):
+        if not self.proc:
+            # Same frames as a reader opened up front: frames close to the start are read forward
+            # from the first one, farther ones are seeked to, like FFMPEG_VideoReader.get_frame does
+            self.initialize(0 if self.get_frame_number(t) <= READ_AHEAD_FRAMES else t)
+        else:
+            self.pool.touch(self)
+        return super().get_frame(t)
+
+    def read_frame(self):
+        if not self.prefetch_frames:
+            return super().read_frame()
+        if self.prefetcher is None:
+            w, h = self.size
+            self.prefetcher = FramePrefetcher(self.proc.stdout, (h, w, self.depth), self.prefetch_frames)
+        frame = self.prefetcher.next_frame()
+        if frame is None:
+            # Same fallback as FFMPEG_VideoReader.read_frame past the end of the stream
+            warnings.warn(f"In file {self.filename}, no frame left to read at frame index {self.pos}. Using the last valid frame instead.", UserWarning)
+            if not hasattr(self, 'last_read'):
+                raise IOError(f"MoviePy error: failed to read the first frame of video file {self.filename}.")
+            frame = self.last_read
+        else:
+            self.last_read = frame
+        self.pos += 1
+        return frame
+
+    def skip_frames(self, n=1):
+        if not self.prefetch_frames:
+            return super().skip_frames(n)
+        for _ in range(n):
+            self.read_frame()
+
+    def close(self, delete_lastread=True):
+        self.pool.forget(self)
+        prefetcher, self.prefetcher = self.prefetcher, None
+        if prefetcher is not None:
+            prefetcher.stop()
+        super().close(delete_lastread=delete_lastread)
+        if prefetcher is not None:
+            prefetcher.join()
+
+
+class PooledVideoFileClip(VideoFileClip):
+    """VideoFileClip reading its frames through a PooledVideoReader."""
+
+    def __init__(self, filename, pool: 'MediaReaderPool', audio=True, prefetch_frames=PREFETCH_FRAMES):
+        VideoClip.__init__(self)
+        self.reader = PooledVideoReader(filename, pool, prefetch_frames=prefetch_frames)
+        self.duration = self.reader.duration
+        self.end = self.reader.duration
+        self.fps = self.reader.fps
+        self.size = self.reader.size
+        self.rotation = self.reader.rotation
+        self.filename = filename
+        self.frame_function = lambda t: self.reader.get_frame(t)
+        if audio and self.reader.infos["audio_found"]:
+            self.audio = AudioFileClip(filename)
+
+
+class MediaReaderPool:
+    """
+    Bounds the number of ffmpeg video readers open at the same time.
+    Readers are opened lazily when their clip is first read, closed when their clip's
+    time window ends (see LayerIntervalIndex), and the least recently used reader is
+    closed whenever more than max_open_readers are open. Process and pipe usage then
+    depends on the number of visible layers, not on the length of the timeline. Each open
+    reader decodes up to prefetch_frames frames ahead (see FramePrefetcher).
+    """
+
+    def __init__(self, max_open_readers=MAX_OPEN_READERS, prefetch_frames=PREFETCH_FRAMES):
+        self.max_open_readers = max_open_readers
+        self.prefetch_frames = prefetch_frames
+        self._open_readers = OrderedDict()
+        self._lock = threading.RLock()
+
+    def open_video_clip(self, filename, audio=True) -> PooledVideoFileClip:
+        clip = PooledVideoFileClip(filename, self, audio=audio, prefetch_frames=self.prefetch_frames)
+        # Kept on every copy of the clip made by its effects, so that the reader can be released with the layer
+        clip.media_reader = clip.reader
+        return clip
+
+    def acquire(self, reader: PooledVideoReader):
+        with self._lock:
+            self._open_readers[id(reader)] = reader
+            self._open_readers.move_to_end(id(reader))
+            while len(self._open_readers) > self.max_open_readers:
+                _, oldest_reader = self._open_readers.popitem(last=False)
+                oldest_reader.close(delete_lastread=False)
+
+    def touch(self, reader: PooledVideoReader):
+        with self._lock:
+            if id(reader) in self._open_readers:
+                self._open_readers.move_to_end(id(reader))
+
+    def forget(self, reader: PooledVideoReader):
+        with self._lock:
+            self._open_readers.pop(id(reader), None)
+
+    def release_clip(self, clip):
+        reader = getattr(clip, 'media_reader', None)
+        if reader is not None:
+            reader.close()
+
+    def get_open_readers_count(self) -> int:
+        with self._lock:
+            return len(self._open_readers)
+
+
+MEDIA_READER_POOL = MediaReaderPool()
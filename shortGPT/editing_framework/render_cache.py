@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Any, Dict
+
+RENDER_CACHE_DIR = '.editing_assets/render_cache/'
+RENDER_CACHE_MAX_SIZE = 5 * 1024 ** 3
+
+
+class RenderCache:
+    """
+    Content-addressed cache of rendered videos.
+    A render is keyed by a canonical hash of its editing schema in which every local
+    media file is replaced by the hash of its content, plus the encoder settings, so
+    an identical render is served from cache_dir even when its assets were regenerated
+    under another path. The cache is bounded to max_size bytes, least recently used
+    renders are evicted first.
+    """
+
+    def __init__(self, cache_dir=RENDER_CACHE_DIR, max_size=RENDER_CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._file_hashes = {}
+        self._lock = threading.Lock()
+
+    def get_key(self, schema: Dict[str, Any], settings: Dict[str, Any]) -> str:
+        canonical = {'schema': self._canonicalize(schema), 'settings': settings}
+        return hashlib.sha256(json.dumps(canonical, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, key, output_file) -> bool:
+        cached_path = self._get_cached_path(key)
+        if not os.path.exists(cached_path):
+            with self._lock:
+                self.misses += 1
+            return False
+        # Refreshing the modification time keeps the render at the end of the LRU order
+        os.utime(cached_path)
+        self._copy(cached_path, output_file)
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key, output_file):
+        cached_path = self._get_cached_path(key)
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        tmp_path = f"{cached_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(output_file, tmp_path)
+        os.replace(tmp_path, cached_path)
+        self.evict()
+
+    def evict(self):
+        cached_files = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.mp4'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    cached_files.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in cached_files)
+        for _, size, path in sorted(cached_files):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def get_file_hash(self, path) -> str:
+        stat = os.stat(path)
+        # Media files are hashed once per process, as long as they are not modified
+        file_id = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if file_id in self._file_hashes:
+                return self._file_hashes[file_id]
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        file_hash = sha.hexdigest()
+        with self._lock:
+            self._file_hashes[file_id] = file_hash
+        return file_hash
+
+    def _canonicalize(self, value):
+        if isinstance(value, dict):
+            return {k: self._canonicalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._canonicalize(v) for v in value]
+        if isinstance(value, str) and os.path.isfile(value):
+            return {'file_sha256': self.get_file_hash(value)}
+        return value
+
+    def _get_cached_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.mp4")
+
+    def _copy(self, cached_path, output_file):
+        if os.path.dirname(output_file):
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        # The output is copied rather than hardlinked: renderers write their output in place, a later render to
+        # the same path would otherwise overwrite the cached render. The previous output is removed first, since
+        # it may itself be a hardlink to a cached render.
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        shutil.copyfile(cached_path, output_file)
+
+
+RENDER_CACHE = RenderCache()
@@ -1,24 +1,105 @@
+from collections import deque
 from proglog import ProgressBarLogger
 import time
 
+# moviepy's progress bars, by rendering phase
+BAR_PHASES = {'frame_index': 'video', 'chunk': 'audio'}
+
+
+class RenderProgressEvent:
+    """
+    Progress of one rendering phase ('video' frames encoded, 'audio' chunks written).
+    """
+
+    def __init__(self, phase, done, total, elapsed_time, speed, estimated_time):
+        self.phase = phase
+        self.done = done
+        self.total = total
+        self.percentage = (done / total) * 100 if total else 0
+        self.elapsed_time = elapsed_time
+        self.speed = speed
+        self.estimated_time = estimated_time
+
+    def to_dict(self):
+        return {
+            'phase': self.phase,
+            'done': self.done,
+            'total': self.total,
+            'percentage': self.percentage,
+            'elapsed_time': self.elapsed_time,
+            'speed': self.speed,
+            'estimated_time': self.estimated_time
+        }
+
+    def __str__(self):
+        return f'Rendering progress : {self.done}/{self.total} | Time spent: {format_time(self.elapsed_time)} | Time left: {format_time(self.estimated_time)}'
+
+
+def format_time(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    return f'{int(minutes)}m {int(seconds)}s'
+
+
 class MoviepyProgressLogger(ProgressBarLogger):
-    
-    def __init__(self, callBackFunction = None):
+    """
+    Turns moviepy/proglog progress bar updates into RenderProgressEvent.
+    Events are throttled: one is emitted when min_interval seconds have passed and the
+    progress moved by at least min_percentage_delta since the last one, and always at the
+    start and the end of a phase. callBackFunction receives the event as the legacy
+    progress string, eventCallBackFunction receives the event itself, and the last
+    emitted events are kept in events.
+    """
+
+    def __init__(self, callBackFunction = None, eventCallBackFunction = None, min_interval=0.5, min_percentage_delta=1, max_events=1000):
         super().__init__()
         self.callBackFunction = callBackFunction
+        self.eventCallBackFunction = eventCallBackFunction
+        self.min_interval = min_interval
+        self.min_percentage_delta = min_percentage_delta
+        self.events = deque(maxlen=max_events)
         self.start_time = time.time()
-    
+        self._phase_starts = {}
+        self._last_emitted = {}
+
     def bars_callback(self, bar, attr, value, old_value=None):
-        # Every time the logger progress is updated, this function is called        
-        percentage = (value / self.bars[bar]['total']) * 100
-        elapsed_time = time.time() - self.start_time
-        estimated_time = (elapsed_time / percentage) * (100 - percentage) if percentage != 0 else 0
-        progress_string = f'Rendering progress : {value}/{self.bars[bar]["total"]} | Time spent: {self.format_time(elapsed_time)} | Time left: {self.format_time(estimated_time)}'
+        # Called on every progress update, most of which are dropped by the throttling
+        if attr != 'index' or not self.bars[bar]['total']:
+            return
+        total = self.bars[bar]['total']
+        now = time.time()
+        if bar not in self._phase_starts or value < self._phase_starts[bar][1]:
+            self._phase_starts[bar] = (now, value)
+            self._last_emitted.pop(bar, None)
+        percentage = (value / total) * 100
+        last_emitted = self._last_emitted.get(bar)
+        is_end = value >= total
+        if last_emitted and not is_end:
+            last_time, last_percentage = last_emitted
+            if now - last_time < self.min_interval or percentage - last_percentage < self.min_percentage_delta:
+                return
+        self._last_emitted[bar] = (now, percentage)
+
+        phase_start_time, phase_start_value = self._phase_starts[bar]
+        phase_time = now - phase_start_time
+        speed = (value - phase_start_value) / phase_time if phase_time > 0 else 0
+        estimated_time = (total - value) / speed if speed > 0 else 0
+        self.emit(RenderProgressEvent(BAR_PHASES.get(bar, bar), value, total, now - self.start_time, speed, estimated_time))
+
+    def emit(self, event: RenderProgressEvent):
+        self.events.append(event)
+        if self.eventCallBackFunction:
+            self.eventCallBackFunction(event)
         if (self.callBackFunction):
-            self.callBackFunction(progress_string)
-        else:
-            print(progress_string)
+            self.callBackFunction(str(event))
+        elif not self.eventCallBackFunction:
+            print(str(event))
 
     def format_time(self, seconds):
-        minutes, seconds = divmod(seconds, 60)
-        return f'{int(minutes)}m {int(seconds)}s'
+        return format_time(seconds)
+
+
+def get_progress_logger(logger) -> MoviepyProgressLogger:
+    # Renderers accept either a MoviepyProgressLogger, to consume the events, or a legacy string callback
+    if isinstance(logger, MoviepyProgressLogger):
+        return logger
+    return MoviepyProgressLogger(callBackFunction=logger)
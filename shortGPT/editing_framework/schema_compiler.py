@@ -0,0 +1,361 @@
+import copy
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from PIL import Image
+
+from shortGPT.config.path_utils import handle_path
+from shortGPT.editing_framework.transform_fusion import compute_position, get_auto_resize_size, get_crop_box, get_resize_size
+
+EPSILON = 1e-6
+# Probed media durations can be slightly off the decoded ones, layers this close to the end of the video are kept
+END_MARGIN = 0.1
+OPAQUE_IMAGE_MODES = {'RGB', 'L', 'CMYK', 'YCbCr'}
+
+# Probes shared by every compiler of the process, keyed by (path, size, modification time), with the probe error
+_MEDIA_INFOS = {}
+_IMAGE_INFOS = {}
+_PROBE_LOCK = threading.Lock()
+
+
+def get_file_id(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def memoize_probe(probes: Dict, path, probe) -> Tuple[Dict[str, Any], Optional[str]]:
+    file_id = get_file_id(path)
+    if file_id is None:
+        return {}, f"{path} not found"
+    with _PROBE_LOCK:
+        if file_id in probes:
+            return probes[file_id]
+    try:
+        result = probe(path), None
+    except Exception as e:
+        result = {}, str(e)
+    with _PROBE_LOCK:
+        probes[file_id] = result
+    return result
+
+
+def probe_media(path) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Returns the ffmpeg infos of a local media file and the probe error, probed once per version of the file."""
+    return memoize_probe(_MEDIA_INFOS, path, ffmpeg_parse_infos)
+
+
+def read_image_infos(path) -> Dict[str, Any]:
+    with Image.open(path) as image:
+        return {'size': list(image.size), 'opaque': image.mode in OPAQUE_IMAGE_MODES and 'transparency' not in image.info}
+
+
+def probe_image(path) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Returns the size and opacity of a local image and the probe error, probed once per version of the file."""
+    return memoize_probe(_IMAGE_INFOS, path, read_image_infos)
+
+
+class CompiledLayer:
+    """Timing and geometry of one asset of an editing schema, as the renderers will play it."""
+
+    __slots__ = ('key', 'assets_key', 'asset', 'type', 'z', 'parameters', 'actions', 'start', 'end', 'duration', 'size', 'position',
+                 'opaque', 'has_audio')
+
+    def __init__(self, key, assets_key, asset: Dict[str, Any]):
+        self.key = key
+        self.assets_key = assets_key
+        self.asset = asset
+        self.type = asset['type']
+        self.z = asset['z']
+        self.parameters = asset['parameters']
+        self.actions = asset['actions']
+        self.start = 0
+        self.end = None
+        self.duration = None
+        self.size = None
+        self.position = None
+        self.opaque = False
+        self.has_audio = False
+
+    def set_end(self, end):
+        # Replaces the set_time_end action of the asset, or adds one
+        for action in self.actions:
+            if action['type'] == 'set_time_end':
+                action['param'] = end
+                break
+        else:
+            self.actions.append({'type': 'set_time_end', 'param': end})
+        self.end = end
+        self.duration = end - self.start
+
+
+class CompileReport:
+    """What the optimization passes of a SchemaCompiler removed or changed."""
+
+    def __init__(self):
+        self.entries = []
+
+    def add(self, pass_name, asset_key, detail):
+        self.entries.append({'pass': pass_name, 'asset': asset_key, 'detail': detail})
+
+    def get_removed_assets(self) -> List[str]:
+        return [entry['asset'] for entry in self.entries if entry['detail'].startswith('removed')]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'entries': self.entries, 'removed_assets': self.get_removed_assets()}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        if not self.entries:
+            return 'no change'
+        return '; '.join(f"{entry['pass']}: {entry['asset']} {entry['detail']}" for entry in self.entries)
+
+
+def set_time_start(layer: CompiledLayer, param):
+    # Same timing rules as moviepy's Clip.with_start, with_end and subclipped
+    layer.start = param
+    if layer.duration is not None:
+        layer.end = layer.start + layer.duration
+    elif layer.end is not None:
+        layer.duration = layer.end - layer.start
+
+
+def set_time_end(layer: CompiledLayer, param):
+    layer.end = param
+    if layer.end is not None:
+        layer.duration = layer.end - layer.start
+
+
+def subclip(layer: CompiledLayer, param):
+    start_time = param.get('start_time', 0)
+    end_time = param.get('end_time')
+    if end_time is None:
+        end_time = layer.duration
+    if end_time is not None:
+        layer.duration = end_time - start_time
+        layer.end = layer.start + layer.duration
+
+
+def loop_background_music(layer: CompiledLayer, param):
+    layer.duration = param
+    layer.end = layer.start + param
+
+
+# Timing actions, applied in the order of the asset actions, like process_common_actions does
+TIMING_ACTIONS = {
+    'set_time_start': set_time_start,
+    'set_time_end': set_time_end,
+    'subclip': subclip,
+}
+# Audio timing actions, applied after the timing actions, like process_audio_actions does
+AUDIO_TIMING_ACTIONS = {
+    'loop_background_music': loop_background_music,
+}
+
+
+class SchemaCompiler:
+    """
+    Compiles an editing schema into CompiledLayer objects holding the timing and geometry
+    the renderers will give each asset, and runs optimization passes over them:
+    drop_empty_layers, clamp_to_duration, merge_captions and prune_occluded_layers.
+    compile returns the optimized schema, rendered by any backend like the original one,
+    and a CompileReport of what was removed. The layer under every other one sets the
+    size of the video, so it is never removed.
+    """
+
+    def __init__(self, passes: List[str] = None):
+        self.passes = passes or ['drop_empty_layers', 'clamp_to_duration', 'merge_captions', 'prune_occluded_layers']
+        self._passes = {
+            'drop_empty_layers': self.drop_empty_layers,
+            'clamp_to_duration': self.clamp_to_duration,
+            'merge_captions': self.merge_captions,
+            'prune_occluded_layers': self.prune_occluded_layers,
+        }
+        # Probe errors of the compiled sources, by url
+        self._probe_errors = {}
+
+    def compile(self, schema: Dict[str, Any], force_duration=None) -> Tuple[Dict[str, Any], CompileReport]:
+        schema = copy.deepcopy(schema)
+        report = CompileReport()
+        visual_layers, audio_layers = self.compile_layers(schema)
+        for layer in visual_layers + audio_layers:
+            url = layer.parameters.get('url')
+            if url in self._probe_errors:
+                report.add('probe', layer.key, f"left unoptimized, {url} could not be probed: {self._probe_errors[url]}")
+        duration = self.get_duration(visual_layers, audio_layers, force_duration)
+        for pass_name in self.passes:
+            if pass_name not in self._passes:
+                raise ValueError(f"Unknown schema compiler pass '{pass_name}', choose one of {list(self._passes.keys())}")
+            visual_layers = self._passes[pass_name](visual_layers, duration, report)
+        kept_keys = {layer.key for layer in visual_layers}
+        schema['visual_assets'] = {key: asset for key, asset in schema['visual_assets'].items() if key in kept_keys}
+        return schema, report
+
+    def compile_layers(self, schema: Dict[str, Any], probe=True) -> Tuple[List[CompiledLayer], List[CompiledLayer]]:
+        """Returns the visual layers of the schema in the order they are drawn, and its audio layers."""
+        visual_layers = [self.compile_layer(key, 'visual_assets', asset, probe=probe)
+                         for key, asset in sorted(schema['visual_assets'].items(), key=lambda item: item[1]['z'])]
+        audio_layers = [self.compile_layer(key, 'audio_assets', asset, probe=probe) for key, asset in schema['audio_assets'].items()]
+        return visual_layers, audio_layers
+
+    def compile_layer(self, key, assets_key, asset: Dict[str, Any], probe=True) -> CompiledLayer:
+        # Without probing, media aren't opened: durations only come from the timing actions and the geometry is unknown
+        layer = CompiledLayer(key, assets_key, asset)
+        if probe and layer.type in ('video', 'audio'):
+            infos = self.get_media_infos(asset['parameters']['url'])
+            if infos.get('duration'):
+                layer.duration = infos['duration']
+                layer.end = infos['duration']
+        for action in asset['actions']:
+            if action['type'] in TIMING_ACTIONS and (action['param'] is not None or action['type'] == 'set_time_end'):
+                TIMING_ACTIONS[action['type']](layer, action['param'])
+        if layer.type == 'audio':
+            for action in asset['actions']:
+                if action['type'] in AUDIO_TIMING_ACTIONS and action['param'] is not None:
+                    AUDIO_TIMING_ACTIONS[action['type']](layer, action['param'])
+        elif probe and layer.type in ('video', 'image'):
+            self.compile_geometry(layer)
+        return layer
+
+    def compile_geometry(self, layer: CompiledLayer):
+        url = layer.parameters['url']
+        actions = layer.actions
+        if layer.type == 'video':
+            infos = self.get_media_infos(url)
+            size = infos.get('video_size')
+            if size and abs(infos.get('video_rotation', 0)) in (90, 270):
+                size = [size[1], size[0]]
+            # Green screened videos are keyed into a transparent overlay
+            layer.opaque = not any(action['type'] == 'green_screen' for action in actions)
+            layer.has_audio = layer.parameters.get('audio', True) and infos.get('audio_found', False)
+        else:
+            infos = self.get_image_infos(url)
+            size = infos.get('size')
+            layer.opaque = infos.get('opaque', False)
+        if not size:
+            return
+        size = list(size)
+        pos, relative = None, False
+        for action in actions:
+            if action['type'] == 'crop':
+                x1, y1, x2, y2 = get_crop_box(size, **action['param'])
+                size = [x2 - x1, y2 - y1]
+            elif action['type'] == 'resize':
+                size = get_resize_size(size, **action['param'])
+            elif action['type'] == 'auto_resize_image':
+                size = get_auto_resize_size(size, **action['param'])
+            elif action['type'] == 'screen_position':
+                pos, relative = action['param']['pos'], action['param'].get('relative', False)
+        layer.size = size
+        layer.position = (pos, relative)
+
+    def get_schema_duration(self, schema: Dict[str, Any], force_duration=None):
+        visual_layers, audio_layers = self.compile_layers(schema)
+        return self.get_duration(visual_layers, audio_layers, force_duration)
+
+    def get_duration(self, visual_layers, audio_layers, force_duration):
+        # Same duration as the video built by CoreEditingEngine.build_video, None when it can't be known without rendering
+        if force_duration:
+            return force_duration
+        layers = audio_layers or visual_layers
+        ends = [layer.end for layer in layers]
+        if not ends or None in ends:
+            return None
+        return max(ends)
+
+    def drop_empty_layers(self, layers: List[CompiledLayer], duration, report: CompileReport) -> List[CompiledLayer]:
+        kept_layers = layers[:1]
+        for layer in layers[1:]:
+            if layer.duration is not None and layer.duration <= 0:
+                report.add('drop_empty_layers', layer.key, f"removed, its duration is {layer.duration:.3f}s")
+                continue
+            kept_layers.append(layer)
+        return kept_layers
+
+    def clamp_to_duration(self, layers: List[CompiledLayer], duration, report: CompileReport) -> List[CompiledLayer]:
+        if duration is None:
+            return layers
+        kept_layers = layers[:1]
+        for layer in layers[1:]:
+            if layer.start >= duration + END_MARGIN:
+                report.add('clamp_to_duration', layer.key, f"removed, it starts at {layer.start:.3f}s after the end of the video ({duration:.3f}s)")
+                continue
+            if layer.end is not None and layer.end > duration + END_MARGIN:
+                report.add('clamp_to_duration', layer.key, f"clamped, its end moved from {layer.end:.3f}s to {duration:.3f}s")
+                layer.set_end(duration)
+            kept_layers.append(layer)
+        return kept_layers
+
+    def merge_captions(self, layers: List[CompiledLayer], duration, report: CompileReport) -> List[CompiledLayer]:
+        kept_layers = []
+        for layer in layers:
+            previous = kept_layers[-1] if kept_layers else None
+            if previous is not None and self.is_caption_continuation(previous, layer):
+                report.add('merge_captions', layer.key, f"removed, merged into {previous.key}")
+                previous.set_end(max(previous.end, layer.end))
+                continue
+            kept_layers.append(layer)
+        return kept_layers
+
+    def is_caption_continuation(self, previous: CompiledLayer, layer: CompiledLayer) -> bool:
+        # Captions are merged when they are drawn at the same depth, with the same look, one right after the other
+        if previous.type != 'text' or layer.type != 'text' or previous.z != layer.z:
+            return False
+        if previous.end is None or layer.end is None or layer.start > previous.end + EPSILON or layer.start < previous.start:
+            return False
+        if previous.parameters != layer.parameters:
+            return False
+        previous_actions = [action for action in previous.actions if action['type'] not in TIMING_ACTIONS]
+        actions = [action for action in layer.actions if action['type'] not in TIMING_ACTIONS]
+        return previous_actions == actions
+
+    def prune_occluded_layers(self, layers: List[CompiledLayer], duration, report: CompileReport) -> List[CompiledLayer]:
+        if not layers or layers[0].size is None:
+            return layers
+        canvas_size = layers[0].size
+        covering_layers = [(i, layer) for i, layer in enumerate(layers) if layer.opaque and self.covers_canvas(layer, canvas_size)]
+        kept_layers = layers[:1]
+        for i, layer in enumerate(layers[1:], start=1):
+            occluder = next((covering for j, covering in covering_layers if j > i and self.covers_time(covering, layer)), None)
+            if occluder is not None and not layer.has_audio:
+                report.add('prune_occluded_layers', layer.key, f"removed, it is hidden by {occluder.key}")
+                continue
+            kept_layers.append(layer)
+        return kept_layers
+
+    def covers_canvas(self, layer: CompiledLayer, canvas_size) -> bool:
+        if layer.size is None:
+            return False
+        pos, relative = layer.position
+        x, y = compute_position(pos, relative, layer.size, canvas_size)
+        return x <= 0 and y <= 0 and x + layer.size[0] >= canvas_size[0] and y + layer.size[1] >= canvas_size[1]
+
+    def covers_time(self, covering: CompiledLayer, layer: CompiledLayer) -> bool:
+        if covering.start > layer.start + EPSILON:
+            return False
+        if covering.end is None:
+            return True
+        return layer.end is not None and covering.end >= layer.end - EPSILON
+
+    def get_media_infos(self, url) -> Dict[str, Any]:
+        # Remote sources aren't probed, their layers are left as they are
+        if url.startswith('http'):
+            return {}
+        infos, error = probe_media(handle_path(url))
+        if error:
+            self._probe_errors[url] = error
+        return infos
+
+    def get_image_infos(self, url) -> Dict[str, Any]:
+        if not os.path.isfile(url):
+            return {}
+        infos, error = probe_image(url)
+        if error:
+            self._probe_errors[url] = error
+        return infos
@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List
+
+from shortGPT.editing_framework.core_editing_engine import CoreEditingEngine
+from shortGPT.editing_framework.encoder_profile import EncoderProfile, get_encoder_profile
+from shortGPT.editing_framework.rendering_logger import get_progress_logger
+
+AUDIO_FPS = 44100
+# Shards shorter than this cost more in process and reader startup than they save
+MIN_SHARD_DURATION = 2
+
+
+def render_shard(schema: Dict[str, Any], output_file, start_frame, end_frame, fps, force_duration=None, threads=None,
+                 encoder_profile: EncoderProfile = None):
+    # Runs in a worker process: frames [start_frame, end_frame) of the timeline, video only
+    encoder_profile = get_encoder_profile(encoder_profile)
+    engine = CoreEditingEngine()
+    # The audio is mixed once by the parent process, force_duration is the length of the whole timeline
+    video = engine.build_video(schema, force_duration=force_duration, with_audio=False)
+    try:
+        _, ffmpeg_params = engine.get_output_settings(schema, video.size, encoder_profile)
+        # Half a frame of slack so that moviepy's int(duration * fps) frame count never loses the last frame to rounding
+        shard = video.subclipped(start_frame / fps, (end_frame + 0.5) / fps)
+        shard.write_videofile(output_file, threads=threads or encoder_profile.threads, codec=encoder_profile.codec,
+                              bitrate=encoder_profile.bitrate, fps=fps, preset=encoder_profile.preset, audio=False,
+                              ffmpeg_params=['-force_key_frames', '0'] + ffmpeg_params, logger=None)
+    finally:
+        close_clips(video)
+    return output_file
+
+
+def close_clips(video):
+    for clip in video.clips:
+        clip.close()
+    if video.audio is not None:
+        video.audio.close()
+
+
+class ShardedEditingEngine:
+    """
+    Renders an editing schema with CoreEditingEngine in parallel worker processes.
+    The timeline is split into shards at scene boundaries (the start of the video
+    layers), every shard is encoded as its own file starting on a keyframe, and the
+    shards are joined with ffmpeg's concat demuxer without re-encoding. The audio
+    is mixed once for the whole timeline, so the shard joins are never audible.
+    """
+
+    def __init__(self, shards=None, fps=25):
+        self.shards = shards or os.cpu_count() or 1
+        self.fps = fps
+
+    def generate_video(self, schema: Dict[str, Any], output_file, logger=None, force_duration=None, threads=None, cut_points=None,
+                       encoder_profile=None):
+        encoder_profile = get_encoder_profile(encoder_profile)
+        self.fps = schema.get('output', {}).get('fps') or encoder_profile.fps
+        video = CoreEditingEngine().build_video(schema, force_duration=force_duration)
+        total_frames = int(video.duration * self.fps)
+        if cut_points is None:
+            cut_points = self.get_cut_points(schema)
+        boundaries = self.get_shard_boundaries(total_frames, cut_points)
+        if len(boundaries) <= 2:
+            close_clips(video)
+            return CoreEditingEngine().generate_video(schema, output_file, logger=logger, force_duration=force_duration, threads=threads,
+                                                      encoder_profile=encoder_profile)
+
+        work_dir = tempfile.mkdtemp(prefix='shortgpt_shards_')
+        try:
+            audio_file = None
+            if video.audio is not None:
+                audio_file = os.path.join(work_dir, 'audio.wav')
+                video.audio.write_audiofile(audio_file, fps=AUDIO_FPS, logger=None)
+            close_clips(video)
+            shard_files = self.render_shards(schema, work_dir, boundaries, logger=logger, force_duration=video.duration, threads=threads,
+                                             encoder_profile=encoder_profile)
+            self.concat_shards(shard_files, audio_file, output_file, total_frames, work_dir, encoder_profile)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return output_file
+
+    def get_cut_points(self, schema: Dict[str, Any]) -> List[float]:
+        # Scene boundaries are where a video layer starts, e.g. each timed stock clip of ContentVideoEngine
+        cut_points = []
+        for asset in schema['visual_assets'].values():
+            if asset['type'] != 'video':
+                continue
+            for action in asset['actions']:
+                if action['type'] == 'set_time_start' and action['param'] is not None:
+                    cut_points.append(action['param'])
+        return cut_points
+
+    def get_shard_boundaries(self, total_frames, cut_points: List[float]) -> List[int]:
+        min_frames = int(MIN_SHARD_DURATION * self.fps)
+        candidates = sorted(set(round(t * self.fps) for t in cut_points))
+        candidates = [frame for frame in candidates if min_frames <= frame <= total_frames - min_frames]
+        boundaries = [0]
+        for i in range(1, self.shards):
+            target = total_frames * i / self.shards
+            eligible = [frame for frame in candidates if frame - boundaries[-1] >= min_frames]
+            if not eligible:
+                break
+            boundaries.append(min(eligible, key=lambda frame: abs(frame - target)))
+        boundaries.append(total_frames)
+        return boundaries
+
+    def render_shards(self, schema: Dict[str, Any], work_dir, boundaries: List[int], logger=None, force_duration=None, threads=None,
+                      encoder_profile: EncoderProfile = None) -> List[str]:
+        my_logger = get_progress_logger(logger)
+        my_logger(frame_index__total=boundaries[-1])
+        shard_files = [os.path.join(work_dir, f"shard_{i:04d}.mp4") for i in range(len(boundaries) - 1)]
+        done_frames = 0
+        # Spawned rather than forked workers: a fork would inherit the pipes of the ffmpeg readers
+        # opened by moviepy in this process, and closing those readers would then block forever
+        mp_context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(self.shards, len(shard_files)), mp_context=mp_context) as executor:
+            futures = {
+                executor.submit(render_shard, schema, shard_file, start_frame, end_frame, self.fps, force_duration, threads, encoder_profile): end_frame - start_frame
+                for shard_file, start_frame, end_frame in zip(shard_files, boundaries[:-1], boundaries[1:])
+            }
+            for future in as_completed(futures):
+                future.result()
+                done_frames += futures[future]
+                my_logger(frame_index__index=done_frames)
+        return shard_files
+
+    def concat_shards(self, shard_files: List[str], audio_file, output_file, total_frames, work_dir, encoder_profile: EncoderProfile = None):
+        encoder_profile = get_encoder_profile(encoder_profile)
+        list_file = os.path.join(work_dir, 'shards.txt')
+        with open(list_file, 'w', encoding='utf-8') as f:
+            for shard_file in shard_files:
+                escaped_path = os.path.abspath(shard_file).replace("'", "'\\''")
+                f.write(f"file '{escaped_path}'\n")
+        command = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_file]
+        if audio_file:
+            command += ['-i', audio_file, '-map', '0:v', '-map', '1:a'] + encoder_profile.get_ffmpeg_audio_args() + ['-ar', str(AUDIO_FPS)]
+        command += ['-c:v', 'copy', '-t', f"{total_frames / self.fps:.6f}"]
+        if encoder_profile.movflags:
+            command += ['-movflags', encoder_profile.movflags]
+        command.append(output_file)
+        output = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if output.returncode != 0:
+            raise Exception(f"Error joining the rendered shards using ffmpeg. {output.stderr.strip()}")
+        return output_file
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict
+
+import numpy as np
+from moviepy import TextClip
+from PIL import Image
+
+TEXT_SPRITE_CACHE_DIR = '.editing_assets/text_sprites/'
+# Parameters that change the rasterized pixels of a TextClip, everything else is ignored for the cache key
+SPRITE_KEY_PARAMS = ['text', 'font', 'font_size', 'color', 'stroke_width', 'stroke_color', 'size', 'method', 'text_align']
+
+
+class TextSpriteCache:
+    """
+    Content-addressed cache of rasterized TextClip sprites.
+    Sprites are stored as RGBA arrays in memory (LRU evicted past max_memory_items)
+    and as RGBA png files in cache_dir, so they survive across renders and processes.
+    """
+
+    def __init__(self, cache_dir=TEXT_SPRITE_CACHE_DIR, max_memory_items=512):
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+        self._sprites = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_key(self, clip_info: Dict[str, Any]) -> str:
+        key_params = {name: clip_info.get(name) for name in SPRITE_KEY_PARAMS}
+        return hashlib.sha256(json.dumps(key_params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get_sprite(self, clip_info: Dict[str, Any]) -> np.ndarray:
+        key = self.get_key(clip_info)
+        with self._lock:
+            if key in self._sprites:
+                self._sprites.move_to_end(key)
+                return self._sprites[key]
+
+        sprite_path = self._get_sprite_file(key, clip_info)
+        sprite = np.array(Image.open(sprite_path).convert('RGBA'))
+        sprite.setflags(write=False)
+        with self._lock:
+            self._sprites[key] = sprite
+            while len(self._sprites) > self.max_memory_items:
+                self._sprites.popitem(last=False)
+        return sprite
+
+    def get_sprite_path(self, clip_info: Dict[str, Any]) -> str:
+        return self._get_sprite_file(self.get_key(clip_info), clip_info)
+
+    def clear_memory(self):
+        with self._lock:
+            self._sprites.clear()
+
+    def _get_sprite_file(self, key, clip_info):
+        sprite_path = os.path.join(self.cache_dir, key[:2], f"{key}.png")
+        if not os.path.exists(sprite_path):
+            os.makedirs(os.path.dirname(sprite_path), exist_ok=True)
+            # Write to a temporary file first so that concurrent renders never read a partial sprite
+            tmp_path = f"{sprite_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            Image.fromarray(self._render_sprite(clip_info)).save(tmp_path, format='PNG')
+            os.replace(tmp_path, sprite_path)
+        return sprite_path
+
+    def _render_sprite(self, clip_info):
+        clip = TextClip(**clip_info)
+        frame = clip.get_frame(0).astype('uint8')
+        if clip.mask is not None:
+            alpha = (clip.mask.get_frame(0) * 255).round().astype('uint8')
+        else:
+            alpha = np.full(frame.shape[:2], 255, dtype='uint8')
+        return np.dstack([frame, alpha])
+
+
+TEXT_SPRITE_CACHE = TextSpriteCache()
@@ -0,0 +1,143 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+from moviepy import Effect
+from PIL import Image
+
+# Actions whose pixels can be folded into a single crop and scale
+GEOMETRIC_ACTIONS = {'crop', 'resize'}
+# Actions that don't change the pixels of a frame, a chain of geometric actions can be folded across them
+FRAME_INDEPENDENT_ACTIONS = {'set_time_start', 'set_time_end', 'subclip', 'screen_position'}
+
+
+@dataclass
+class CropResize(Effect):
+    """
+    Crops the box (x1, y1, x2, y2), in source pixels that may be fractional, and scales
+    it to size, with one LANCZOS resampling. The mask is transformed the same way.
+    """
+
+    box: List[float] = None
+    size: List[int] = None
+
+    def transform_frame(self, frame):
+        if frame.dtype == np.uint8:
+            return np.array(Image.fromarray(frame).resize(tuple(self.size), Image.Resampling.LANCZOS, box=tuple(self.box)))
+        # Masks are resampled as 8 bits images, like moviepy's Resize does
+        mask = Image.fromarray((255 * frame).astype('uint8'))
+        return np.array(mask.resize(tuple(self.size), Image.Resampling.LANCZOS, box=tuple(self.box))) / 255.0
+
+    def apply(self, clip):
+        return clip.image_transform(self.transform_frame, apply_to=['mask'])
+
+
+def get_crop_box(size, x1=None, y1=None, x2=None, y2=None, width=None, height=None, x_center=None, y_center=None):
+    # Same bounds as moviepy's Crop effect, clamped to the frame like numpy slicing does
+    if width and x1 is not None:
+        x2 = x1 + width
+    elif width and x2 is not None:
+        x1 = x2 - width
+    if height and y1 is not None:
+        y2 = y1 + height
+    elif height and y2 is not None:
+        y1 = y2 - height
+    if x_center:
+        x1, x2 = x_center - width / 2, x_center + width / 2
+    if y_center:
+        y1, y2 = y_center - height / 2, y_center + height / 2
+    w, h = size
+    x1, x2 = min(max(int(x1 or 0), 0), w), min(int(x2 or w), w)
+    y1, y2 = min(max(int(y1 or 0), 0), h), min(int(y2 or h), h)
+    return x1, y1, x2, y2
+
+
+def get_resize_size(size, new_size=None, height=None, width=None):
+    # Same output size as moviepy's Resize effect
+    w, h = size
+    if new_size is not None:
+        if isinstance(new_size, (int, float)):
+            new_size = [new_size * w, new_size * h]
+    elif height is not None:
+        new_size = [w * height / h, height]
+    elif width is not None:
+        new_size = [width, h * width / w]
+    else:
+        raise ValueError("You must provide either 'new_size' or 'height' or 'width'")
+    return [int(new_size[0]), int(new_size[1])]
+
+
+def get_auto_resize_size(size, maxWidth, maxHeight):
+    # Same output size as the auto_resize_image action of CoreEditingEngine
+    ar = size[0] / size[1]
+    if ar < 1:
+        return get_resize_size(size, new_size=(maxHeight * ar, maxHeight))
+    return get_resize_size(size, new_size=(maxWidth, maxWidth / ar))
+
+
+def compute_position(pos, relative, size, canvas_size):
+    # Top left corner of a layer of size placed at pos, the way moviepy's with_position places a clip on the canvas
+    if pos is None:
+        pos = (0, 0)
+    if isinstance(pos, str):
+        pos = {
+            "center": ["center", "center"],
+            "left": ["left", "center"],
+            "right": ["right", "center"],
+            "top": ["center", "top"],
+            "bottom": ["center", "bottom"],
+        }[pos]
+    else:
+        pos = list(pos)
+    if relative:
+        for i, dim in enumerate(canvas_size):
+            if not isinstance(pos[i], str):
+                pos[i] = dim * pos[i]
+    if isinstance(pos[0], str):
+        pos[0] = {"left": 0, "center": (canvas_size[0] - size[0]) / 2, "right": canvas_size[0] - size[0]}[pos[0]]
+    if isinstance(pos[1], str):
+        pos[1] = {"top": 0, "center": (canvas_size[1] - size[1]) / 2, "bottom": canvas_size[1] - size[1]}[pos[1]]
+    return int(pos[0]), int(pos[1])
+
+
+def fuse_geometric_actions(actions: List[Dict[str, Any]], size) -> List[Dict[str, Any]]:
+    """
+    Folds every chain of crop and resize actions that contains a resize and more than one
+    action into a single crop_resize action, so that e.g. the crop, upscale and crop of
+    CROP_1920x1080_TO_SHORT resample each frame once instead of scaling a full frame that
+    is mostly cropped away. size is the size of the frames the actions are applied to.
+    """
+    fused_actions = []
+    chain = []
+    # Geometry of the chain: the source box (in source pixels) shown by the current frame, and its size
+    box, current_size = None, list(size)
+
+    def flush_chain():
+        if len(chain) > 1 and any(action['type'] == 'resize' for action in chain):
+            fused_actions.append({'type': 'crop_resize', 'param': {'box': list(box), 'size': list(current_size)}})
+        else:
+            fused_actions.extend(chain)
+        chain.clear()
+
+    for action in actions:
+        if action['type'] in GEOMETRIC_ACTIONS:
+            if not chain:
+                box = [0, 0, current_size[0], current_size[1]]
+            scale_x = (box[2] - box[0]) / current_size[0]
+            scale_y = (box[3] - box[1]) / current_size[1]
+            if action['type'] == 'crop':
+                x1, y1, x2, y2 = get_crop_box(current_size, **action['param'])
+                box = [box[0] + x1 * scale_x, box[1] + y1 * scale_y, box[0] + x2 * scale_x, box[1] + y2 * scale_y]
+                current_size = [x2 - x1, y2 - y1]
+            else:
+                current_size = get_resize_size(current_size, **action['param'])
+            chain.append(action)
+        elif action['type'] in FRAME_INDEPENDENT_ACTIONS:
+            fused_actions.append(action)
+        else:
+            flush_chain()
+            fused_actions.append(action)
+            if action['type'] == 'auto_resize_image':
+                current_size = get_auto_resize_size(current_size, **action['param'])
+    flush_chain()
+    return fused_actions
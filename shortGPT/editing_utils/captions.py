@@ -33,6 +33,13 @@ def getTimestampMapping(whisper_analysis):
     return locationToTimestamp
 
 
+def getTranscriptionFromWordTimings(word_timings, tempo=1.0):
+    # Word timings of a voice module, as a whisper analysis, with the times of an audio played tempo times faster
+    words = [{'text': word['text'], 'start': word['start'] / tempo, 'end': word['end'] / tempo} for word in word_timings]
+    text = ' '.join(word['text'] for word in words)
+    return {'text': text, 'segments': [{'start': words[0]['start'], 'end': words[-1]['end'], 'text': text, 'words': words}] if words else []}
+
+
 def splitWordsBySize(words, maxCaptionSize):
     halfCaptionSize = maxCaptionSize / 2
     captions = []
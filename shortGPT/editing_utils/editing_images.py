@@ -1,7 +1,20 @@
 from shortGPT.api_utils.image_api import getBingImages
+from shortGPT.editing_framework.transform_fusion import get_auto_resize_size
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from PIL import Image
 from tqdm import tqdm
+import hashlib
+import json
+import os
 import random
 import math
+import requests
+
+IMAGE_CACHE_DIR = '.editing_assets/images/'
+IMAGE_CACHE_MAX_SIZE = 1024 ** 3
+MAX_IMAGE_DOWNLOADS = 8
+IMAGE_DOWNLOAD_TIMEOUT = 10
 
 def getImageUrlsTimed(imageTextPairs):
     return [(pair[0], searchImageUrlsFromQuery(pair[1])) for pair in tqdm(imageTextPairs, desc='Search engine queries for images...')]
@@ -17,4 +30,77 @@ def searchImageUrlsFromQuery(query, top=3, expected_dim=[720,720], retries=5):
         for distance in shortest_ones:
             image_url = images[distances.index(distance)]['url']
             return image_url
-    return None
\ No newline at end of file
+    return None
+
+
+def prefetchImagesTimed(timedImageUrls, maxWidth=None, maxHeight=None, max_workers=MAX_IMAGE_DOWNLOADS, timeout=IMAGE_DOWNLOAD_TIMEOUT):
+    # Downloads every image concurrently, the images that can't be fetched or decoded are left out
+    urls = list(dict.fromkeys(url for _, url in timedImageUrls if url))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        paths = dict(zip(urls, executor.map(lambda url: prefetchImage(url, maxWidth, maxHeight, timeout), urls)))
+    evictImageCache(keepPaths=[path for path in paths.values() if path])
+    return [(timing, paths[url]) for timing, url in timedImageUrls if paths.get(url)]
+
+
+def prefetchImage(url, maxWidth=None, maxHeight=None, timeout=IMAGE_DOWNLOAD_TIMEOUT):
+    source_id = [url, os.stat(url).st_mtime_ns] if os.path.isfile(url) else [url]
+    key = hashlib.sha256(json.dumps([source_id, maxWidth, maxHeight]).encode('utf-8')).hexdigest()
+    image_path = os.path.join(IMAGE_CACHE_DIR, f"{key}.png")
+    try:
+        # Refreshing the modification time keeps the image at the end of the LRU order
+        os.utime(image_path)
+        return image_path
+    except FileNotFoundError:
+        pass
+    try:
+        if os.path.isfile(url):
+            with open(url, 'rb') as f:
+                data = f.read()
+        else:
+            response = requests.get(url, timeout=timeout, headers={'User-Agent': 'Mozilla/5.0'})
+            response.raise_for_status()
+            data = response.content
+        image = Image.open(BytesIO(data))
+        image.load()
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        if maxWidth and maxHeight:
+            # Downscaled to the size the image is shown at, larger images are never decoded again
+            size = get_auto_resize_size(image.size, maxWidth, maxHeight)
+            if size[0] < image.size[0] and size[1] < image.size[1]:
+                image = image.resize(tuple(size), Image.Resampling.LANCZOS)
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{image_path}.{os.getpid()}.tmp"
+        image.save(tmp_path, format='PNG')
+        os.replace(tmp_path, image_path)
+        return image_path
+    except Exception as e:
+        print(f"Failed to prefetch image {url}. Error : {str(e)}")
+        return None
+
+
+def evictImageCache(max_size=IMAGE_CACHE_MAX_SIZE, keepPaths=()):
+    # Least recently used images are removed first, until the cache fits in max_size bytes. The images of keepPaths are never removed
+    keepPaths = {os.path.abspath(path) for path in keepPaths}
+    cached_files = []
+    if not os.path.isdir(IMAGE_CACHE_DIR):
+        return
+    for name in os.listdir(IMAGE_CACHE_DIR):
+        if name.endswith('.png'):
+            path = os.path.join(IMAGE_CACHE_DIR, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            cached_files.append((stat.st_mtime, stat.st_size, path))
+    total_size = sum(size for _, size, _ in cached_files)
+    for _, size, path in sorted(cached_files):
+        if total_size <= max_size:
+            break
+        if os.path.abspath(path) in keepPaths:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
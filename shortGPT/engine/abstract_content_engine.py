@@ -1,10 +1,16 @@
 import os
 from abc import ABC
 
+from shortGPT.audio import audio_utils
+from shortGPT.audio.audio_duration import get_asset_duration
+from shortGPT.audio.voice_cache import CachedVoiceModule
 from shortGPT.audio.voice_module import VoiceModule
 from shortGPT.config.languages import Language
 from shortGPT.config.path_utils import get_program_path
 from shortGPT.database.content_database import ContentDatabase
+from shortGPT.editing_framework.encoder_profile import get_encoder_profile
+from shortGPT.editing_framework.rendering_logger import MoviepyProgressLogger
+from shortGPT.editing_utils import captions
 
 CONTENT_DB = ContentDatabase()
 
@@ -21,10 +27,14 @@ class AbstractContentEngine(ABC):
         self.initializeFFMPEG()
         self.prepareEditingPaths()
         self._db_language = language.value
-        self.voiceModule = voiceModule
+        self.voiceModule = voiceModule if isinstance(voiceModule, CachedVoiceModule) else CachedVoiceModule(voiceModule)
         self.stepDict = {}
         self.default_logger = lambda _: None
         self.logger = self.default_logger
+        self.encoder_profile = get_encoder_profile()
+        self.render_event_callback = None
+        self.draft_preview_callback = None
+        self.incremental_render = False
 
     def __getattr__(self, name):
         if name.startswith('_db_'):
@@ -95,6 +105,49 @@ class AbstractContentEngine(ABC):
     def set_logger(self, logger):
         self.logger = logger
 
+    def set_render_event_callback(self, render_event_callback):
+        # Receives the RenderProgressEvent of the renders, for consumers that don't want the progress strings
+        self.render_event_callback = render_event_callback
+
+    def set_encoder_profile(self, encoder_profile):
+        self.encoder_profile = get_encoder_profile(encoder_profile)
+
+    def set_draft_preview(self, draft_preview_callback):
+        # Called with the path of a low resolution draft rendered before the final video,
+        # the final render is cancelled when it returns False
+        self.draft_preview_callback = draft_preview_callback
+
+    def set_incremental_render(self, incremental_render):
+        # Caches the background videos apart from the overlays, for contents re-rendered with other captions or images
+        self.incremental_render = incremental_render
+
+    def renderVideo(self, videoEditor, outputPath, **kwargs):
+        # The profile is saved with the content, so every rendered video records how it was encoded
+        self._db_encoder_profile = self.encoder_profile.to_dict()
+        logger = self.logger if self.logger is not self.default_logger else None
+        if self.render_event_callback:
+            logger = MoviepyProgressLogger(callBackFunction=logger, eventCallBackFunction=self.render_event_callback)
+        kwargs.setdefault('incremental', self.incremental_render)
+        if self.draft_preview_callback:
+            draftPath = "_draft".join(os.path.splitext(outputPath))
+            videoEditor.renderVideo(draftPath, logger=logger, draft=True, **kwargs)
+            self._db_draft_video_path = draftPath
+            if self.draft_preview_callback(draftPath) is False:
+                raise Exception(f"The final render of {outputPath} was cancelled after the draft preview {draftPath}")
+        videoEditor.renderVideo(outputPath, logger=logger, encoder_profile=self.encoder_profile, **kwargs)
+
+    def _getVoiceTranscription(self):
+        # Word timings of the synthesized voiceover, from the voice module when it gave them, transcribed by whisper otherwise
+        if not self._db_voice_word_timings:
+            return audio_utils.audioToText(self._db_audio_path)
+        tempo = 1.0
+        if self._db_audio_path != self._db_temp_audio_path:
+            _, temp_duration = get_asset_duration(self._db_temp_audio_path, isVideo=False)
+            _, duration = get_asset_duration(self._db_audio_path, isVideo=False)
+            if temp_duration and duration:
+                tempo = temp_duration / duration
+        return captions.getTranscriptionFromWordTimings(self._db_voice_word_timings, tempo)
+
     def initializeFFMPEG(self):
         ffmpeg_path = get_program_path("ffmpeg")
         if not ffmpeg_path:
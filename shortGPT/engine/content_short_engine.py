@@ -9,7 +9,8 @@ from shortGPT.audio.audio_duration import get_asset_duration
 from shortGPT.audio.voice_module import VoiceModule
 from shortGPT.config.asset_db import AssetDatabase
 from shortGPT.config.languages import Language
-from shortGPT.editing_framework.editing_engine import (EditingEngine,
+from shortGPT.editing_framework.editing_engine import (EDITING_TEMPLATE_REGISTRY,
+                                                       EditingEngine,
                                                        EditingStep)
 from shortGPT.editing_utils import captions, editing_images
 from shortGPT.editing_utils.handle_videos import extract_random_clip_from_video
@@ -59,7 +60,7 @@ class ContentShortEngine(AbstractContentEngine):
         if (self._db_language != Language.ENGLISH.value):
             self._db_translated_script = gpt_translate.translateContent(script, self._db_language)
             script = self._db_translated_script
-        self._db_temp_audio_path = self.voiceModule.generate_voice(
+        self._db_temp_audio_path, self._db_voice_word_timings = self.voiceModule.generate_voice_with_timings(
             script, self.dynamicAssetDir + "temp_audio_path.wav")
 
     def _speedUpAudio(self):
@@ -71,7 +72,7 @@ class ContentShortEngine(AbstractContentEngine):
 
     def _timeCaptions(self):
         self.verifyParameters(audioPath=self._db_audio_path)
-        whisper_analysis = audio_utils.audioToText(self._db_audio_path)
+        whisper_analysis = self._getVoiceTranscription()
         self._db_timed_captions = captions.getCaptionsWithTime(
             whisper_analysis)
 
@@ -86,6 +87,13 @@ class ContentShortEngine(AbstractContentEngine):
             self._db_timed_image_urls = editing_images.getImageUrlsTimed(
                 self._db_timed_image_searches)
 
+    def _prefetchTimedImages(self):
+        # The images are downloaded and downscaled to their displayed size before rendering, instead of being read from their urls by the renderer
+        if not self._db_timed_image_urls:
+            return []
+        max_size = EDITING_TEMPLATE_REGISTRY.get_step(EditingStep.SHOW_IMAGE).get_action_param('auto_resize_image') or {}
+        return editing_images.prefetchImagesTimed(self._db_timed_image_urls, **max_size)
+
     def _chooseBackgroundMusic(self):
         self._db_background_music_url = AssetDatabase.get_asset_link(self._db_background_music_name)
 
@@ -130,7 +138,8 @@ class ContentShortEngine(AbstractContentEngine):
                                                                           "volume_percentage": 0.11})
             videoEditor.addEditingStep(EditingStep.CROP_1920x1080, {
                                        'url': self._db_background_trimmed})
-            videoEditor.addEditingStep(EditingStep.ADD_SUBSCRIBE_ANIMATION, {'url': AssetDatabase.get_asset_link('subscribe animation')})
+            videoEditor.addEditingStep(EditingStep.ADD_SUBSCRIBE_ANIMATION, {'url': AssetDatabase.get_asset_link('subscribe animation'),
+                                                                             'source_name': 'subscribe animation'})
 
             if self._db_watermark:
                 videoEditor.addEditingStep(EditingStep.ADD_WATERMARK, {
@@ -142,14 +151,14 @@ class ContentShortEngine(AbstractContentEngine):
                                                           'set_time_start': timing[0],
                                                           'set_time_end': timing[1]})
             if self._db_num_images:
-                for timing, image_url in self._db_timed_image_urls:
-                    videoEditor.addEditingStep(EditingStep.SHOW_IMAGE, {'url': image_url,
+                for timing, image_path in self._prefetchTimedImages():
+                    videoEditor.addEditingStep(EditingStep.SHOW_IMAGE, {'url': image_path,
                                                                         'set_time_start': timing[0],
                                                                         'set_time_end': timing[1]})
             print("***** SCHEMA FOR RENDERING ****")
             print(videoEditor.dumpEditingSchema())
             print("***** SCHEMA FOR RENDERING ****")
-            videoEditor.renderVideo(outputPath, logger= self.logger if self.logger is not self.default_logger else None)
+            self.renderVideo(videoEditor, outputPath)
 
         self._db_video_path = outputPath
 
@@ -6,9 +6,10 @@ import shutil
 from tqdm import tqdm
 
 from shortGPT.audio.audio_duration import get_asset_duration
-from shortGPT.audio.audio_utils import (audioToText, get_asset_duration,
-                                        run_background_audio_split,
-                                        speedUpAudio)
+from shortGPT.audio.audio_utils import (audioToText,
+                                        generateTimedVoiceBlocks,
+                                        get_asset_duration,
+                                        run_background_audio_split)
 from shortGPT.audio.voice_module import VoiceModule
 from shortGPT.config.languages import ACRONYM_LANGUAGE_MAPPING, Language
 from shortGPT.editing_framework.editing_engine import (EditingEngine,
@@ -69,16 +70,10 @@ class ContentTranslationEngine(AbstractContentEngine):
     def _generate_translated_audio(self):
         self.verifyParameters(translated_timed_sentences=self._db_translated_timed_sentences)
 
-        translated_audio_blocks = []
-        for i, ((t1, t2), translated_text) in tqdm(enumerate(self._db_translated_timed_sentences), desc="Generating translated audio"):
-            self.logger(f"3/5 - Generating translated audio - {i+1} / {len(self._db_translated_timed_sentences)}")
-            translated_voice = self.voiceModule.generate_voice(translated_text, self.dynamicAssetDir+f"translated_{i}_{self._db_target_language}.wav")
-            if not translated_voice:
-                raise Exception('An error happending during audio voice creation')
-            final_audio_path = speedUpAudio(translated_voice, self.dynamicAssetDir+f"translated_{i}_{self._db_target_language}_spedup.wav", expected_duration=t2-t1 - 0.05)
-            _, translated_duration = get_asset_duration(final_audio_path, isVideo=False)
-            translated_audio_blocks.append([[t1, t1+translated_duration], final_audio_path])
-        self._db_audio_bits = translated_audio_blocks
+        self.logger(f"3/5 - Generating translated audio - 0 / {len(self._db_translated_timed_sentences)}")
+        self._db_audio_bits = generateTimedVoiceBlocks(self.voiceModule, self._db_translated_timed_sentences,
+                                                       self.dynamicAssetDir+"translated_", suffix=f"_{self._db_target_language}",
+                                                       logger=lambda progress: self.logger(f"3/5 - Generating translated audio - {progress}"))
 
     def _edit_and_render_video(self):
         self.verifyParameters(_db_audio_bits=self._db_audio_bits)
@@ -117,7 +112,7 @@ class ContentTranslationEngine(AbstractContentEngine):
     
         self._db_video_path = self.dynamicAssetDir+"translated_content.mp4"
 
-        editing_engine.renderVideo(self._db_video_path, logger= self.logger if self.logger is not self.default_logger else None)
+        self.renderVideo(editing_engine, self._db_video_path)
     def _add_metadata(self):
         self.logger(f"5 / 5 - Saving translated video")
         now = datetime.datetime.now()
@@ -4,7 +4,6 @@ import os
 import re
 import shutil
 import traceback
-import ffmpeg
 
 from shortGPT.api_utils.pexels_api import getBestVideo as getBestVideoPexels
 from shortGPT.api_utils.pixabay_api import get_best_video_pixabay as getBestVideoPixabay
@@ -25,8 +24,9 @@ from shortGPT.database.db_handler import VideoMetadataDB
 class ContentVideoEngine(AbstractContentEngine):
 
     def __init__(self, voiceModule: VoiceModule, script: str, background_music_name="", id="",
-                 watermark_logo=None, isVerticalFormat=False, language: Language = Language.ENGLISH, api_source = "Pexels", text_position = "Middle", quality = "HD"):
+                 watermark_logo=None, isVerticalFormat=False, language: Language = Language.ENGLISH, api_source = "Pexels", text_position = "Middle", quality = "HD", render_shards=1):
         super().__init__(id, "general_video", language, voiceModule)
+        self.render_shards = render_shards
         if not id:
             if (watermark_logo):
                 self._db_watermark_logo = watermark_logo
@@ -62,7 +62,7 @@ class ContentVideoEngine(AbstractContentEngine):
         if (self._db_language != Language.ENGLISH.value):
             self._db_translated_script = gpt_translate.translateContent(script, self._db_language)
             script = self._db_translated_script
-        self._db_temp_audio_path = self.voiceModule.generate_voice(
+        self._db_temp_audio_path, self._db_voice_word_timings = self.voiceModule.generate_voice_with_timings(
             script, self.dynamicAssetDir + "temp_audio_path.wav")
 
     def _speedUpAudio(self):
@@ -77,7 +77,7 @@ class ContentVideoEngine(AbstractContentEngine):
 
     def _timeCaptions(self):
         self.verifyParameters(audioPath=self._db_audio_path)
-        whisper_analysis = audio_utils.audioToText(self._db_audio_path)
+        whisper_analysis = self._getVoiceTranscription()
         max_len = 15
         if not self._db_format_vertical:
             max_len = 30
@@ -147,7 +147,7 @@ class ContentVideoEngine(AbstractContentEngine):
         self.verifyParameters(
             voiceover_audio_url=self._db_audio_path)
 
-        outputPath = self.dynamicAssetDir + "rendered_video.mp4"
+        outputPath = self.dynamicAssetDir + "rendered_final_video.mp4"
         if not (os.path.exists(outputPath)):
             self.logger("Rendering short: Starting automated editing...")
             videoEditor = EditingEngine()
@@ -188,39 +188,21 @@ class ContentVideoEngine(AbstractContentEngine):
                                                          'set_time_start': t1,
                                                          'set_time_end': t2})
 
-            videoEditor.renderVideo(outputPath, logger=self.logger if self.logger is not self.default_logger else None)
-
-            mv = ffmpeg.input(outputPath)
-            av1 = mv.audio
-            stream = mv.video
-
-            if(self._db_format_vertical):
-                if(self.quality=="4k"):
-                    stream = stream.filter('fps', fps=25, round='up').filter('scale', w=2160, h=3840)
-                elif(self.quality=="HD"):
-                    stream = stream.filter('fps', fps=25, round='up').filter('scale', w=1080, h=1920)
-                elif(self.quality=="SD"):
-                    stream = stream.filter('fps', fps=25, round='up').filter('scale', w=480, h=720)
-                else:
-                    print("Invalid resolution choice. Using default resolution (HD).")
-                    stream = stream.filter('fps', fps=25, round='up').filter('scale', w=1080, h=1920)
-            else:
-                if(self.quality=="4k"):
-                    stream = stream.filter('fps', fps=25, round='up').filter('scale', w=3840, h=2160)
-                elif(self.quality=="HD"):
-                    stream = stream.filter('fps', fps=25, round='up').filter('scale', w=1920, h=1080)
-                elif(self.quality=="SD"):
-                    stream = stream.filter('fps', fps=25, round='up').filter('scale', w=720, h=480)
-                else:
-                    print("Invalid resolution choice. Using default resolution (HD).")
-                    stream = stream.filter('fps', fps=25, round='up').filter('scale', w=1920, h=1080)
-            outputvideo = self.dynamicAssetDir + "rendered_final_video.mp4"
-            outputPath = None
-
-
-            ffmpeg.output(av1, stream,outputvideo, vcodec='libx264', acodec='aac', strict='-2').run(overwrite_output=True)
-            
-            self._db_video_path = outputvideo
+            videoEditor.setOutputFormat(self._getOutputSize(), fps=25)
+            # With render_shards > 1 the timeline is rendered in parallel, cut at the background clips in _timed_video_urls
+            self.renderVideo(videoEditor, outputPath, shards=self.render_shards)
+
+        self._db_video_path = outputPath
+
+    def _getOutputSize(self):
+        if self._db_format_vertical:
+            sizes = {"4k": (2160, 3840), "HD": (1080, 1920), "SD": (480, 720)}
+        else:
+            sizes = {"4k": (3840, 2160), "HD": (1920, 1080), "SD": (720, 480)}
+        if self.quality not in sizes:
+            print("Invalid resolution choice. Using default resolution (HD).")
+            return sizes["HD"]
+        return sizes[self.quality]
 
 
     def _addMetadata(self):
@@ -0,0 +1,93 @@
+"""
+MixedAudioClip must sound like the moviepy CompositeAudioClip of the same audio assets.
+
+Both read the same 16 bits sources, the mixer through one ffmpeg decode into float32 samples and
+moviepy through its AudioFileClip readers, so the mixes may only differ by the rounding of a few
+16 bits samples: MAX_SAMPLE_DIFF is 4 quantization steps of the full scale.
+"""
+import wave
+
+import numpy as np
+import pytest
+from moviepy import AudioFileClip, CompositeAudioClip
+
+from shortGPT.editing_framework.audio_mixer import AUDIO_FPS, AudioMixer
+from shortGPT.editing_framework.core_editing_engine import CoreEditingEngine
+
+MAX_SAMPLE_DIFF = 4 / 32768
+DURATION = 2
+# Samples per read, moviepy's write_audiofile default buffer. AudioFileClip readers go wrong on reads larger than their buffer
+CHUNK_SIZE = 2000
+
+
+def write_wav(path, frequency, duration=DURATION):
+    t = np.arange(int(duration * AUDIO_FPS)) / AUDIO_FPS
+    # Different left and right channels, so that a channel swap shows up
+    left = 0.6 * np.sin(2 * np.pi * frequency * t)
+    right = 0.3 * np.sin(2 * np.pi * frequency * 1.5 * t + 1)
+    samples = (np.stack([left, right], axis=1) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(AUDIO_FPS)
+        f.writeframes(samples.tobytes())
+
+
+@pytest.fixture(scope='module')
+def sources(tmp_path_factory):
+    media_dir = tmp_path_factory.mktemp('audio')
+    paths = [str(media_dir / 'voice.wav'), str(media_dir / 'music.wav')]
+    write_wav(paths[0], 220)
+    write_wav(paths[1], 330)
+    return paths
+
+
+def make_schema(sources, voice_actions, music_actions):
+    return {'visual_assets': {}, 'audio_assets': {
+        'voice': {'type': 'audio', 'z': 0, 'parameters': {'url': sources[0]}, 'actions': voice_actions},
+        'music': {'type': 'audio', 'z': 1, 'parameters': {'url': sources[1]}, 'actions': music_actions},
+    }}
+
+
+def mix_with_moviepy(schema):
+    engine = CoreEditingEngine()
+    clips = [engine.process_audio_actions(AudioFileClip(asset['parameters']['url']), asset['actions'])
+             for asset in schema['audio_assets'].values()]
+    return CompositeAudioClip(clips)
+
+
+@pytest.mark.parametrize('voice_actions, music_actions', [
+    (
+        [{'type': 'subclip', 'param': {'start_time': 0.25, 'end_time': 1.5}},
+         {'type': 'set_time_start', 'param': 0.4},
+         {'type': 'volume_percentage', 'param': 0.7}],
+        [{'type': 'set_time_start', 'param': 0.1},
+         {'type': 'volume_percentage', 'param': 0.3}],
+    ),
+    (
+        [{'type': 'set_time_start', 'param': 0.5},
+         {'type': 'set_time_end', 'param': 1.75}],
+        [{'type': 'subclip', 'param': {'start_time': 1}},
+         {'type': 'normalize_music', 'param': None},
+         {'type': 'loop_background_music', 'param': 2.5},
+         {'type': 'volume_percentage', 'param': 0.2}],
+    ),
+], ids=['subclip_offsets_volume', 'end_normalize_loop'])
+def test_mix_matches_composite_audio_clip(sources, voice_actions, music_actions):
+    schema = make_schema(sources, voice_actions, music_actions)
+    expected = mix_with_moviepy(schema)
+    mixed = AudioMixer().build_clip(schema)
+    try:
+        assert mixed.duration == pytest.approx(expected.duration)
+        # Every sample of the mix, read in chunks like the audio writers do
+        tt = np.arange(int(expected.duration * AUDIO_FPS)) / AUDIO_FPS
+        for chunk_start in range(0, len(tt), CHUNK_SIZE):
+            chunk = tt[chunk_start:chunk_start + CHUNK_SIZE]
+            expected_chunk, mixed_chunk = expected.get_frame(chunk), mixed.get_frame(chunk)
+            assert mixed_chunk.shape == expected_chunk.shape
+            assert np.abs(mixed_chunk - expected_chunk).max() <= MAX_SAMPLE_DIFF
+        # The mix isn't silent, the tracks were actually compared
+        assert np.abs(mixed.get_frame(tt[:CHUNK_SIZE * 10:5])).max() > 0.1
+    finally:
+        mixed.close()
+        expected.close()
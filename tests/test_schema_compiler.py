@@ -0,0 +1,155 @@
+"""
+The SchemaCompiler passes remove or shorten layers, so they must only do it when the render can't change:
+captions are merged only when they are drawn the same way back to back, layers are pruned only when an
+opaque full-canvas layer hides them and they have no audio, and layers are clamped at the video duration.
+"""
+import wave
+
+import numpy as np
+import pytest
+from moviepy import AudioClip, ColorClip
+from PIL import Image
+
+from shortGPT.editing_framework.schema_compiler import SchemaCompiler
+
+CANVAS_SIZE = (64, 36)
+
+
+@pytest.fixture(scope='module')
+def media(tmp_path_factory):
+    media_dir = tmp_path_factory.mktemp('media')
+    paths = {
+        'opaque_image': str(media_dir / 'opaque.png'),
+        'transparent_image': str(media_dir / 'transparent.png'),
+        'video': str(media_dir / 'video.mp4'),
+        'voiceover': str(media_dir / 'voiceover.wav'),
+    }
+    Image.new('RGB', CANVAS_SIZE, (200, 30, 30)).save(paths['opaque_image'])
+    Image.new('RGBA', CANVAS_SIZE, (30, 200, 30, 128)).save(paths['transparent_image'])
+    audio = AudioClip(lambda t: np.sin(440 * 2 * np.pi * t), duration=2, fps=44100)
+    video = ColorClip(CANVAS_SIZE, color=(30, 30, 200), duration=2).with_audio(audio)
+    video.write_videofile(paths['video'], fps=10, codec='libx264', audio_codec='aac', logger=None)
+    with wave.open(paths['voiceover'], 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(b'\x00\x00' * 8000 * 3)
+    return paths
+
+
+def make_asset(asset_type, z, parameters, start=None, end=None, actions=()):
+    timing_actions = [{'type': 'set_time_start', 'param': start}, {'type': 'set_time_end', 'param': end}]
+    return {'type': asset_type, 'z': z, 'parameters': parameters, 'actions': timing_actions + list(actions)}
+
+
+def make_caption(text, z, start, end, font_size=20):
+    position = {'type': 'screen_position', 'param': {'pos': 'center'}}
+    return make_asset('text', z, {'text': text, 'font_size': font_size}, start, end, [position])
+
+
+def make_schema(visual_assets, audio_assets=None):
+    return {'visual_assets': visual_assets, 'audio_assets': audio_assets or {}}
+
+
+def get_end(asset):
+    return next(action['param'] for action in asset['actions'] if action['type'] == 'set_time_end')
+
+
+def compile_schema(schema, passes, force_duration=None):
+    return SchemaCompiler(passes).compile(schema, force_duration=force_duration)
+
+
+def test_back_to_back_identical_captions_are_merged(media):
+    schema = make_schema({
+        'background': make_asset('image', 0, {'url': media['opaque_image']}, 0, 3),
+        'caption_1': make_caption('Hello', 1, 0, 1),
+        'caption_2': make_caption('Hello', 1, 1, 2.5),
+    })
+    compiled, report = compile_schema(schema, ['merge_captions'])
+    assert list(compiled['visual_assets']) == ['background', 'caption_1']
+    assert get_end(compiled['visual_assets']['caption_1']) == 2.5
+    assert report.get_removed_assets() == ['caption_2']
+    # The source schema is left untouched
+    assert get_end(schema['visual_assets']['caption_1']) == 1
+
+
+@pytest.mark.parametrize('second_caption', [
+    make_caption('World', 1, 1, 2),
+    make_caption('Hello', 1, 1.5, 2),
+    make_caption('Hello', 2, 1, 2),
+    make_caption('Hello', 1, 1, 2, font_size=30),
+], ids=['other_text', 'gap', 'other_depth', 'other_style'])
+def test_different_or_separated_captions_are_not_merged(media, second_caption):
+    schema = make_schema({
+        'background': make_asset('image', 0, {'url': media['opaque_image']}, 0, 3),
+        'caption_1': make_caption('Hello', 1, 0, 1),
+        'caption_2': second_caption,
+    })
+    compiled, report = compile_schema(schema, ['merge_captions'])
+    assert list(compiled['visual_assets']) == ['background', 'caption_1', 'caption_2']
+    assert len(report) == 0
+
+
+@pytest.mark.parametrize('keeps_audio', [False, True], ids=['without_audio', 'with_audio'])
+def test_layer_hidden_by_opaque_full_canvas_layer(media, keeps_audio):
+    schema = make_schema({
+        'background': make_asset('image', 0, {'url': media['opaque_image']}, 0, 3),
+        'hidden': make_asset('video', 1, {'url': media['video'], 'audio': keeps_audio}, 0.5, 1.5),
+        'cover': make_asset('image', 2, {'url': media['opaque_image']}, 0, 2),
+    })
+    compiled, report = compile_schema(schema, ['prune_occluded_layers'])
+    if keeps_audio:
+        # Its audio would still be heard
+        assert 'hidden' in compiled['visual_assets']
+        assert len(report) == 0
+    else:
+        assert list(compiled['visual_assets']) == ['background', 'cover']
+        assert report.entries == [{'pass': 'prune_occluded_layers', 'asset': 'hidden', 'detail': 'removed, it is hidden by cover'}]
+
+
+@pytest.mark.parametrize('image, start, actions', [
+    ('transparent_image', 0, []),
+    ('opaque_image', 1, []),
+    ('opaque_image', 0, [{'type': 'resize', 'param': {'new_size': 0.5}}]),
+], ids=['transparent', 'shorter', 'smaller'])
+def test_partially_hiding_layers_dont_prune(media, image, start, actions):
+    schema = make_schema({
+        'background': make_asset('image', 0, {'url': media['opaque_image']}, 0, 3),
+        'hidden': make_asset('video', 1, {'url': media['video'], 'audio': False}, 0.5, 1.5),
+        'cover': make_asset('image', 2, {'url': media[image]}, start, 2, actions),
+    })
+    compiled, report = compile_schema(schema, ['prune_occluded_layers'])
+    assert 'hidden' in compiled['visual_assets']
+    assert len(report) == 0
+
+
+def test_layers_are_clamped_at_the_video_duration(media):
+    schema = make_schema({
+        'background': make_asset('image', 0, {'url': media['opaque_image']}, 0, 5),
+        'running_past': make_caption('Past the end', 1, 1, 5),
+        'within_margin': make_caption('Almost the end', 2, 1, 3.05),
+        'after_end': make_caption('After the end', 3, 3.5, 4),
+    }, {'voiceover': {'type': 'audio', 'z': 0, 'parameters': {'url': media['voiceover']}, 'actions': []}})
+    compiled, report = compile_schema(schema, ['clamp_to_duration'])
+    visual_assets = compiled['visual_assets']
+    assert list(visual_assets) == ['background', 'running_past', 'within_margin']
+    # The bottom layer sets the size of the video, it is never changed
+    assert get_end(visual_assets['background']) == 5
+    assert get_end(visual_assets['running_past']) == pytest.approx(3)
+    assert get_end(visual_assets['within_margin']) == 3.05
+    assert report.get_removed_assets() == ['after_end']
+    assert [entry['asset'] for entry in report.entries] == ['running_past', 'after_end']
+
+
+def test_forced_duration_clamps_and_unknown_duration_doesnt(media):
+    schema = make_schema({
+        'background': make_asset('image', 0, {'url': media['opaque_image']}, 0, 5),
+        'caption': make_caption('Hello', 1, 1, 5),
+    })
+    compiled, _ = compile_schema(schema, ['clamp_to_duration'], force_duration=2)
+    assert get_end(compiled['visual_assets']['caption']) == 2
+    # Without audio, a layer with no end makes the duration unknown
+    schema['visual_assets']['open_ended'] = make_asset('image', 2, {'url': media['opaque_image']}, 0, None)
+    compiled, report = compile_schema(schema, ['clamp_to_duration'])
+    assert get_end(compiled['visual_assets']['caption']) == 5
+    assert len(report) == 0
@@ -0,0 +1,96 @@
+"""
+Fused crop/resize chains must render like the sequential moviepy effects they replace.
+
+"Equivalent" means:
+- the frames and masks have the same size;
+- away from the borders, the pixels are identical;
+- within EDGE_BAND pixels of a border, a chain that crops before downscaling may differ slightly.
+  The fused LANCZOS resampling reads the source pixels just outside the crop box, which the
+  sequential chain had already cropped away.
+"""
+import json
+import os
+
+import numpy as np
+import pytest
+from moviepy import ImageClip, vfx
+
+from shortGPT.editing_framework.transform_fusion import CropResize, fuse_geometric_actions
+
+STEPS_DIR = os.path.join(os.path.dirname(__file__), '..', 'shortGPT', 'editing_framework', 'editing_steps')
+# LANCZOS reads 3 pixels on each side, at the output resolution when downscaling
+EDGE_BAND = 3
+EDGE_MAX_DIFF = 32
+MAX_MEAN_DIFF = 0.5
+
+DOWNSCALE_CHAIN = [
+    {'type': 'crop', 'param': {'x1': 421, 'y1': 3, 'width': 1077, 'height': 1075}},
+    {'type': 'resize', 'param': {'new_size': 0.37}},
+]
+DOWNSCALE_CROP_CHAIN = [
+    {'type': 'resize', 'param': {'width': 640}},
+    {'type': 'crop', 'param': {'x1': 100, 'y1': 50, 'width': 320, 'height': 240}},
+]
+
+
+def load_step_actions(step_file, asset_key):
+    with open(os.path.join(STEPS_DIR, step_file), 'r', encoding='utf-8') as f:
+        return json.load(f)[asset_key]['actions']
+
+
+def make_frame(width, height):
+    # Smooth gradients with hard edges, so that resampling differences show up
+    y, x = np.mgrid[0:height, 0:width]
+    red = 127.5 + 127.5 * np.sin(x / 37.0) * np.cos(y / 23.0)
+    green = x * 255 // width
+    blue = ((x // 60 + y // 60) % 2) * 255
+    alpha = 60 + red // 2
+    return np.dstack([red, green, blue, alpha]).astype('uint8')
+
+
+def apply_sequential(clip, actions):
+    for action in actions:
+        effect = vfx.Crop(**action['param']) if action['type'] == 'crop' else vfx.Resize(**action['param'])
+        clip = clip.with_effects([effect])
+    return clip
+
+
+def apply_fused(clip, actions):
+    fused_actions = fuse_geometric_actions(actions, clip.size)
+    assert [action['type'] for action in fused_actions] == ['crop_resize']
+    return clip.with_effects([CropResize(**fused_actions[0]['param'])])
+
+
+def render_both(actions):
+    clip = ImageClip(make_frame(1920, 1080), transparent=True)
+    sequential, fused = apply_sequential(clip, actions), apply_fused(clip, actions)
+    return (sequential.get_frame(0), fused.get_frame(0)), (sequential.mask.get_frame(0), fused.mask.get_frame(0))
+
+
+def assert_equivalent(expected, actual, scale=1):
+    assert expected.shape == actual.shape
+    diff = np.abs(expected.astype(float) - actual.astype(float)) * scale
+    assert np.array_equal(expected[EDGE_BAND:-EDGE_BAND, EDGE_BAND:-EDGE_BAND], actual[EDGE_BAND:-EDGE_BAND, EDGE_BAND:-EDGE_BAND])
+    assert diff.max() <= EDGE_MAX_DIFF
+    assert diff.mean() <= MAX_MEAN_DIFF
+
+
+def test_crop_to_short_chain_is_identical():
+    actions = load_step_actions('crop_1920x1080_to_short.json', 'background_video')
+    (sequential, fused), (sequential_mask, fused_mask) = render_both(actions)
+    assert fused.shape == (1920, 1080, 3)
+    assert np.array_equal(sequential, fused)
+    assert np.array_equal(sequential_mask, fused_mask)
+
+
+@pytest.mark.parametrize('actions', [DOWNSCALE_CHAIN, DOWNSCALE_CROP_CHAIN], ids=['crop_downscale', 'downscale_crop'])
+def test_downscale_chains_are_equivalent(actions):
+    (sequential, fused), (sequential_mask, fused_mask) = render_both(actions)
+    assert_equivalent(sequential, fused)
+    # Masks are in [0, 1], compared on the same 8 bits scale as the frames
+    assert_equivalent(sequential_mask, fused_mask, scale=255)
+
+
+def test_chains_without_resize_are_not_fused():
+    actions = [{'type': 'crop', 'param': {'x1': 10, 'width': 100}}, {'type': 'crop', 'param': {'y1': 5, 'height': 50}}]
+    assert fuse_geometric_actions(actions, [1920, 1080]) == actions